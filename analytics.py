@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objective_stats (
+  objective_id TEXT PRIMARY KEY,
+  correct INTEGER NOT NULL DEFAULT 0,
+  total INTEGER NOT NULL DEFAULT 0,
+  users INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT NOT NULL
+);
+"""
+
+# mergedQuizScores is keyed by the hub's domain names; map them onto the
+# AZ104_OBJECTIVES domain ids. App Service & Containers is part of Compute in
+# the current exam outline (older clients still send it separately).
+DOMAIN_KEYS = {
+    "Identities": "1",
+    "Storage": "2",
+    "Compute": "3",
+    "App Service & Containers": "3",
+    "Networking": "4",
+    "Monitoring": "5",
+}
+
+
+def objective_id(score_key, known_ids):
+    if score_key in DOMAIN_KEYS:
+        return DOMAIN_KEYS[score_key]
+    return score_key if score_key in known_ids else None
+
+
+def objective_ids(objectives):
+    ids = set()
+    for domain in objectives["domains"]:
+        ids.add(domain["id"])
+        ids.update(objective["id"] for objective in domain["objectives"])
+    return ids
+
+
+def _count(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) and value > 0 else 0
+
+
+def document_counts(document, known_ids):
+    # {objective id: (correct, total)} for one user's sync document.
+    counts = {}
+    scores = document.get("mergedQuizScores") if isinstance(document, dict) else None
+    if not isinstance(scores, dict):
+        return counts
+    for key, score in scores.items():
+        target = objective_id(key, known_ids)
+        if target is None or not isinstance(score, dict):
+            continue
+        total = _count(score.get("total"))
+        correct = min(_count(score.get("correct")), total)
+        if not total:
+            continue
+        prev_correct, prev_total = counts.get(target, (0, 0))
+        counts[target] = (prev_correct + correct, prev_total + total)
+    return counts
+
+
+def _accuracy(correct, total):
+    return round(correct / total, 4) if total else None
+
+
+class ObjectiveAnalytics:
+    # Cohort-wide correct/attempt counters per objective id. Each sync write
+    # adds the difference between the user's old and new document, so the
+    # counters stay current without rescanning every user; `rebuild`
+    # recomputes them from scratch for backfill or after a crash between a
+    # sync write and its counter update.
+    def __init__(self, db_path, objectives):
+        self.db_path = db_path
+        self.objectives = objectives
+        self.known_ids = objective_ids(objectives)
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _deltas(self, old, new):
+        before = document_counts(old, self.known_ids)
+        after = document_counts(new, self.known_ids)
+        for target in set(before) | set(after):
+            old_correct, old_total = before.get(target, (0, 0))
+            new_correct, new_total = after.get(target, (0, 0))
+            users = (1 if new_total else 0) - (1 if old_total else 0)
+            if new_correct != old_correct or new_total != old_total or users:
+                yield target, new_correct - old_correct, new_total - old_total, users
+
+    def record_writes(self, changes):
+        # changes: iterable of (old document or None, new document).
+        rows = [delta for old, new in changes for delta in self._deltas(old, new)]
+        if not rows:
+            return
+        now = datetime.utcnow().isoformat() + "Z"
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO objective_stats (objective_id, correct, total, users, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(objective_id) DO UPDATE SET correct = correct + excluded.correct, '
+                'total = total + excluded.total, users = users + excluded.users, updated_at = excluded.updated_at',
+                ((target, correct, total, users, now) for target, correct, total, users in rows)
+            )
+
+    def record_write(self, old, new):
+        self.record_writes([(old, new)])
+
+    def rebuild(self, rows):
+        # rows: iterable of documents (dicts or raw JSON bytes), one per user.
+        totals = {}
+        users = 0
+        for document in rows:
+            if isinstance(document, (bytes, str)):
+                document = json.loads(document)
+            users += 1
+            for target, (correct, total) in document_counts(document, self.known_ids).items():
+                entry = totals.setdefault(target, [0, 0, 0])
+                entry[0] += correct
+                entry[1] += total
+                entry[2] += 1
+        now = datetime.utcnow().isoformat() + "Z"
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM objective_stats')
+            conn.executemany(
+                'INSERT INTO objective_stats (objective_id, correct, total, users, updated_at) VALUES (?, ?, ?, ?, ?)',
+                ((target, c, t, u, now) for target, (c, t, u) in totals.items())
+            )
+        return {"users": users, "objectives": len(totals)}
+
+    def counters(self):
+        rows = self._connect().execute('SELECT objective_id, correct, total, users, updated_at FROM objective_stats')
+        return {row[0]: {"correct": row[1], "total": row[2], "users": row[3], "updatedAt": row[4]} for row in rows}
+
+    def report(self):
+        counters = self.counters()
+        empty = {"correct": 0, "total": 0, "users": 0}
+
+        def entry(item):
+            stats = counters.get(item["id"], empty)
+            return {
+                "id": item["id"],
+                "name": item["name"],
+                "correct": stats["correct"],
+                "total": stats["total"],
+                "users": stats["users"],
+                "accuracy": _accuracy(stats["correct"], stats["total"])
+            }
+
+        domains = []
+        for domain in self.objectives["domains"]:
+            result = entry(domain)
+            result["objectives"] = [entry(objective) for objective in domain["objectives"]]
+            domains.append(result)
+        measured = [item for domain in domains for item in [domain] + domain["objectives"] if item["total"]]
+        weakest = sorted(measured, key=lambda item: (item["accuracy"], -item["total"]))
+        updated = [stats["updatedAt"] for stats in counters.values()]
+        return {
+            "domains": domains,
+            "weakest": [item["id"] for item in weakest],
+            "updatedAt": max(updated) if updated else None
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the cohort objective analytics counters.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Recompute every counter from the stored sync documents")
+    sub.add_parser("show", help="Print the per-objective report")
+    args = parser.parse_args(argv)
+
+    import server
+    analytics = server.objective_analytics
+
+    if args.command == "rebuild":
+        summary = analytics.rebuild(raw for _, raw, _, _ in server.sync_store.export_rows())
+        print(json.dumps(summary))
+        return 0
+
+    print(json.dumps(analytics.report(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# Async entry point:  python asgi.py   (or: uvicorn asgi:app)
+#
+# The two LLM-bound routes, POST /api/extract-concepts and
+# POST /api/generate-cprs, are served here as coroutines on the async OpenAI
+# client: a request waiting on the model holds a socket and a few KB of
+# coroutine state instead of a thread. Every other route is the unchanged
+# Flask app, run on a small thread pool, so static and sync traffic never
+# queues behind model calls.
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+from a2wsgi import WSGIMiddleware
+
+import server
+import metrics
+
+
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+ASGI_MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", str(1024 * 1024)))
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-expose-headers", b"ETag, Content-Encoding"),
+]
+
+wsgi_app = WSGIMiddleware(server.app, workers=ASGI_WSGI_THREADS)
+
+
+class BadRequest(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_json(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise BadRequest("Client disconnected", 499)
+        body += message.get("body", b"")
+        if len(body) > ASGI_MAX_BODY_BYTES:
+            raise BadRequest("Request body too large", 413)
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        raise BadRequest("Request body is not valid JSON")
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def allm_complete(provider, endpoint, messages, max_tokens):
+    usage = {}
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        return await provider.acomplete(messages, max_tokens=max_tokens, usage=usage)
+    except Exception as e:
+        outcome = server.failure_reason(e)
+        raise
+    finally:
+        server.record_llm_call(endpoint, outcome, time.perf_counter() - start, usage)
+
+
+async def arequest_extract(provider, raw_text):
+    messages = server.extract_messages(raw_text)
+    key = server.content_key(f'extract-concepts-{provider.name}', messages[1]["content"])
+    return json.loads(await server.llm_async_flight.do(key, lambda: allm_complete(provider, 'extract-concepts', messages, 2000)))
+
+
+async def arequest_summary(provider, concepts, chunk_summaries):
+    try:
+        return json.loads(await allm_complete(provider, 'extract-summary', server.summary_messages(concepts), 300))['summary']
+    except Exception:
+        return " ".join(s for s in chunk_summaries if s)
+
+
+# The async counterpart of server.extract_fanout_slots: one cap on chunk
+# calls across every review this process is handling.
+fanout_slots = asyncio.Semaphore(max(1, server.EXTRACT_FANOUT_CONCURRENCY))
+
+
+async def arequest_extract_chunked(provider, chunks):
+    async def one(chunk):
+        async with fanout_slots:
+            return await arequest_extract(provider, chunk)
+
+    outcomes = await asyncio.gather(*(one(chunk) for chunk in chunks), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+            raise outcome
+    result, summaries = server.merge_chunk_results(outcomes)
+    async with fanout_slots:
+        result['summary'] = await arequest_summary(provider, result['concepts'], summaries)
+    return result
+
+
+async def aanalyze_review(raw_text):
+    # Keyword matching, cache lookups and cache writes are CPU or disk work,
+    # so they run on the default executor rather than on the event loop.
+    plan, response = await asyncio.to_thread(server.plan_review, raw_text)
+    if response is not None:
+        return response
+    provider = server.llm_provider
+    try:
+        if len(plan["chunks"]) > 1:
+            result = await arequest_extract_chunked(provider, plan["chunks"])
+        else:
+            result = await arequest_extract(provider, raw_text)
+        return await asyncio.to_thread(server.finish_review, plan, result)
+    except Exception as e:
+        return server.extract_fallback(plan["local_concepts"], plan["guide_refs"], str(e), server.failure_reason(e))
+
+
+async def extract_concepts(receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+        await send_json(send, {"error": "No text provided"}, 400)
+        return
+    await send_json(send, await aanalyze_review(data['text']))
+
+
+async def generate_cprs(receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get('concept', ''), str):
+        await send_json(send, {"error": "concept must be a string"}, 400)
+        return
+    concept, guide_refs, response = await asyncio.to_thread(server.plan_cprs, data)
+    if response is not None:
+        payload, status = response
+        await send_json(send, payload, status)
+        return
+
+    provider = server.llm_provider
+    messages = server.cprs_messages(concept)
+    key = server.content_key(f'generate-cprs-{provider.name}', messages[1]["content"])
+    try:
+        result = json.loads(await server.llm_async_flight.do(key, lambda: allm_complete(provider, 'generate-cprs', messages, 3000)))
+        payload = await asyncio.to_thread(server.finish_cprs, concept, guide_refs, result)
+    except Exception as e:
+        payload = server.cprs_failure(concept, guide_refs, e)
+    await send_json(send, payload)
+
+
+ASYNC_ROUTES = {
+    ("POST", "/api/extract-concepts"): extract_concepts,
+    ("POST", "/api/generate-cprs"): generate_cprs,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    # The Flask app records its own request metrics; these routes bypass it.
+    start = time.perf_counter()
+    seen = {"status": 500, "request_bytes": 0, "response_bytes": 0}
+
+    async def counted_receive():
+        message = await receive()
+        seen["request_bytes"] += len(message.get("body", b""))
+        return message
+
+    async def counted_send(message):
+        if message["type"] == "http.response.start":
+            seen["status"] = message["status"]
+            seen["elapsed"] = time.perf_counter() - start
+        elif message["type"] == "http.response.body":
+            seen["response_bytes"] += len(message.get("body", b""))
+        await send(message)
+
+    try:
+        await handler(counted_receive, counted_send)
+    except BadRequest as e:
+        if e.status != 499:
+            await send_json(counted_send, {"error": str(e)}, e.status)
+        else:
+            seen["status"] = 499
+    finally:
+        server.record_request(scope["path"], scope["method"], seen["status"], seen.get("elapsed", time.perf_counter() - start),
+                              seen["request_bytes"], seen["response_bytes"])
+
+
+def main():
+    import uvicorn
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    if float(os.environ.get("SYNC_WRITE_BEHIND_INTERVAL", "0")) > 0:
+        # Same constraint as gunicorn.conf.py: the write-behind buffer is
+        # per process.
+        workers = 1
+    if workers > 1 and not os.environ.get("METRICS_DIR"):
+        # See gunicorn.conf.py; uvicorn's workers inherit the variable.
+        os.environ["METRICS_DIR"] = os.path.join(tempfile.gettempdir(), f"az104-metrics-{os.getpid()}")
+    if os.environ.get("METRICS_DIR"):
+        metrics.reset(os.environ["METRICS_DIR"])
+    uvicorn.run(
+        "asgi:app",
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", "5000")),
+        workers=workers,
+        backlog=int(os.environ.get("ASGI_BACKLOG", "2048")),
+        timeout_graceful_shutdown=int(os.environ.get("ASGI_GRACEFUL_TIMEOUT", "30")),
+        access_log=bool(os.environ.get("ASGI_ACCESS_LOG")),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import zlib
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Stored payloads start with one header byte naming the codec, so entries
+# written with different settings can live side by side and be decoded
+# without consulting configuration.
+RAW = 0
+GZIP = 1
+ZSTD = 2
+
+CODEC_NAMES = {"raw": RAW, "gzip": GZIP, "zstd": ZSTD}
+
+# Below this size the header and codec framing cost more than they save.
+MIN_COMPRESS_BYTES = 256
+
+
+class CompressionError(ValueError):
+    pass
+
+
+class UnsupportedEncoding(CompressionError):
+    pass
+
+
+def zstd_available():
+    return zstandard is not None
+
+
+def brotli_available():
+    return brotli is not None
+
+
+def default_codec():
+    return "zstd" if zstd_available() else "gzip"
+
+
+def encode_payload(raw, codec="auto", level=None):
+    if codec == "auto":
+        codec = default_codec()
+    if codec not in CODEC_NAMES:
+        raise ValueError(f"Unknown codec {codec!r}")
+    if codec == "zstd" and not zstd_available():
+        raise ValueError("zstd requested but the zstandard package is not installed")
+    if codec == "raw" or len(raw) < MIN_COMPRESS_BYTES:
+        return bytes([RAW]) + raw
+    if codec == "zstd":
+        body = zstandard.ZstdCompressor(level=level or 3).compress(raw)
+    else:
+        body = gzip.compress(raw, compresslevel=level or 6, mtime=0)
+    if len(body) >= len(raw):
+        return bytes([RAW]) + raw
+    return bytes([CODEC_NAMES[codec]]) + body
+
+
+def decode_payload(blob):
+    # Rows written before compression hold the JSON text itself.
+    if isinstance(blob, str):
+        return blob.encode('utf-8')
+    if not blob:
+        raise CompressionError("Empty payload")
+    header, body = blob[0], bytes(blob[1:])
+    if header == RAW:
+        return body
+    if header == GZIP:
+        return gzip.decompress(body)
+    if header == ZSTD:
+        if not zstd_available():
+            raise CompressionError("Payload is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if header in b'{[':
+        return bytes(blob)
+    raise CompressionError(f"Unknown payload header byte {header}")
+
+
+def payload_codec(blob):
+    if isinstance(blob, str) or not blob or blob[0] not in CODEC_NAMES.values():
+        return "legacy"
+    return {value: name for name, value in CODEC_NAMES.items()}[blob[0]]
+
+
+# HTTP content-coding helpers for request and response bodies.
+
+def supported_encodings():
+    return ("zstd", "gzip") if zstd_available() else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding, offered=None):
+    # Picks the highest-q coding we can produce; ties go to the order in
+    # `offered`. Returns None for identity.
+    offered = offered or supported_encodings()
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+    best = None
+    for coding in offered:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def compress_body(body, encoding):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if encoding == "zstd" and zstd_available():
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "br" and brotli_available():
+        return brotli.compress(body, quality=5)
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding {encoding!r}")
+
+
+def decompress_body(body, encoding, max_size):
+    # Bounded so a small compressed request cannot expand into gigabytes.
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding in ('gzip', 'x-gzip'):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            result = decompressor.decompress(body, max_size + 1)
+        except zlib.error as e:
+            raise CompressionError(f"Invalid gzip body: {e}")
+        if len(result) > max_size or decompressor.unconsumed_tail:
+            raise CompressionError("Decompressed body exceeds the size limit")
+        return result
+    if encoding == 'zstd' and zstd_available():
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            result = reader.read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise CompressionError(f"Invalid zstd body: {e}")
+        if len(result) > max_size:
+            raise CompressionError("Decompressed body exceeds the size limit")
+        return result
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding {encoding!r}")
@@ -0,0 +1,205 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import importlib
+import threading
+from datetime import datetime
+
+
+# Sets are keyed by the provider that generated them, so placeholder sets
+# from the fake provider are never served by a server talking to OpenAI.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cprs_sets (
+  concept_key TEXT NOT NULL,
+  objective TEXT NOT NULL DEFAULT '',
+  provider TEXT NOT NULL DEFAULT 'openai',
+  concept TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  PRIMARY KEY (concept_key, objective, provider)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cprs_sets_objective ON cprs_sets(objective);
+"""
+
+# Banks created before the provider column held OpenAI sets only.
+ADD_PROVIDER = """
+BEGIN;
+ALTER TABLE cprs_sets RENAME TO cprs_sets_v1;
+DROP INDEX IF EXISTS idx_cprs_sets_objective;
+""" + SCHEMA + """
+INSERT INTO cprs_sets (concept_key, objective, provider, concept, payload, created_at)
+  SELECT concept_key, objective, 'openai', concept, payload, created_at FROM cprs_sets_v1;
+DROP TABLE cprs_sets_v1;
+COMMIT;
+"""
+
+DEFAULT_PROVIDER = "openai"
+
+
+def normalize_concept(concept):
+    return re.sub(r'[^a-z0-9]+', ' ', concept.lower()).strip()
+
+
+def normalize_objective(objective):
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', objective or '')
+    return match.group(1) if match else ''
+
+
+class CprsBank:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cprs_sets)')]
+        if columns and 'provider' not in columns:
+            conn.executescript(ADD_PROVIDER)
+        with conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, concept, objective=None, provider=DEFAULT_PROVIDER):
+        key = normalize_concept(concept)
+        if not key:
+            return None
+        conn = self._connect()
+        if objective:
+            row = conn.execute(
+                'SELECT payload FROM cprs_sets WHERE concept_key = ? AND objective = ? AND provider = ?',
+                (key, normalize_objective(objective), provider)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                'SELECT payload FROM cprs_sets WHERE concept_key = ? AND provider = ? ORDER BY created_at DESC LIMIT 1',
+                (key, provider)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, concept, payload, objective=None, provider=DEFAULT_PROVIDER):
+        key = normalize_concept(concept)
+        objective = normalize_objective(objective or payload.get('objective'))
+        now = datetime.utcnow().isoformat() + "Z"
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cprs_sets (concept_key, objective, provider, concept, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, objective, provider, concept, json.dumps(payload), now)
+            )
+
+    def has(self, concept, objective=None, provider=DEFAULT_PROVIDER):
+        return self.get(concept, objective, provider) is not None
+
+    def stats(self):
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM cprs_sets').fetchone()[0]
+        by_objective = dict(conn.execute(
+            'SELECT objective, COUNT(*) FROM cprs_sets GROUP BY objective ORDER BY objective'
+        ).fetchall())
+        by_provider = dict(conn.execute(
+            'SELECT provider, COUNT(*) FROM cprs_sets GROUP BY provider ORDER BY provider'
+        ).fetchall())
+        return {"total": total, "by_objective": by_objective, "by_provider": by_provider}
+
+
+def objective_skills(objectives):
+    for domain in objectives["domains"]:
+        for objective in domain["objectives"]:
+            for skill in objective["skills"]:
+                yield skill, objective["id"]
+
+
+def backend_provider(spec):
+    # Sets from "fake" are stored for fake-provider servers only; everything
+    # else is real content for OpenAI-backed servers.
+    return "fake" if spec == "fake" else DEFAULT_PROVIDER
+
+
+def load_backend(spec):
+    # "openai" and "fake" use the server's own prompt through an LLM provider;
+    # anything else is a "module:function" taking a concept and returning the
+    # CPRS JSON dict.
+    if spec in ('openai', 'fake'):
+        import server
+        from llm_providers import FakeProvider, provider_from_env, resilient_from_env
+        if spec == 'fake':
+            provider = FakeProvider()
+        else:
+            os.environ["LLM_PROVIDER"] = "openai"
+            provider = resilient_from_env(provider_from_env())
+            if provider is None:
+                raise SystemExit("OPENAI_API_KEY is not set")
+        return lambda concept: server.request_cprs(provider, concept)
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise SystemExit(f"Backend must be 'openai', 'fake' or 'module:function', got {spec!r}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def pregenerate(bank, backend, targets, force=False, provider=DEFAULT_PROVIDER):
+    generated = skipped = failed = 0
+    for concept, objective in targets:
+        if not force and bank.has(concept, objective, provider):
+            skipped += 1
+            continue
+        try:
+            payload = backend(concept)
+        except Exception as e:
+            print(f"❌ {concept}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        if not payload.get('questions'):
+            print(f"❌ {concept}: backend returned no questions", file=sys.stderr)
+            failed += 1
+            continue
+        bank.put(concept, payload, objective, provider)
+        generated += 1
+        print(f"✅ {objective or '-'} {concept}")
+    return {"generated": generated, "skipped": skipped, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the stored CPRS question bank.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("pregenerate", help="Generate question sets for objective skills and guide topics")
+    gen.add_argument("--backend", default="openai", help="'openai', 'fake' or 'module:function'")
+    gen.add_argument("--source", choices=["skills", "guides", "all"], default="all")
+    gen.add_argument("--limit", type=int, default=0, help="Stop after this many targets (0 = no limit)")
+    gen.add_argument("--force", action="store_true", help="Regenerate sets that are already stored")
+
+    sub.add_parser("stats", help="Show stored set counts per objective")
+
+    args = parser.parse_args(argv)
+
+    import server
+    bank = server.cprs_bank
+
+    if args.command == "stats":
+        print(json.dumps(bank.stats(), indent=2))
+        return 0
+
+    targets = []
+    if args.source in ("skills", "all"):
+        targets.extend(objective_skills(server.AZ104_OBJECTIVES))
+    if args.source in ("guides", "all"):
+        targets.extend((key, None) for key in server.GUIDE_INDEX)
+    if args.limit:
+        targets = targets[:args.limit]
+
+    summary = pregenerate(bank, load_backend(args.backend), targets, force=args.force,
+                          provider=backend_provider(args.backend))
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
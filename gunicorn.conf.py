@@ -0,0 +1,71 @@
+# Production entry point:  gunicorn -c gunicorn.conf.py server:app
+#
+# Each worker process runs a pool of threads, so a slow OpenAI call ties up
+# one thread rather than the instance. `kill -HUP <master pid>` reloads the
+# code by starting new workers and retiring the old ones once their in-flight
+# requests finish; `kill -TERM` shuts down gracefully.
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+if float(os.environ.get("SYNC_WRITE_BEHIND_INTERVAL", "0")) > 0:
+    # The write-behind buffer is per process; several workers would each
+    # hold their own unflushed copy of a user's document.
+    workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+
+# Above LLM_READ_TIMEOUT plus retries, so a worker is only killed when it is
+# really stuck.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers now and then to bound memory growth; jitter keeps them from
+# restarting together.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+
+# server.py starts background threads (write-behind flushing) at import and
+# registers an atexit flush, so the app is loaded in each worker rather than
+# once in the master, where forked children would not inherit the threads.
+preload_app = False
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+# Workers publish their metrics to this directory so /metrics reports totals
+# for the whole server whichever worker answers the scrape. Workers inherit
+# the variable from the master.
+_own_metrics_dir = workers > 1 and not os.environ.get("METRICS_DIR")
+if _own_metrics_dir:
+    os.environ["METRICS_DIR"] = os.path.join(tempfile.gettempdir(), f"az104-metrics-{os.getpid()}")
+
+
+def on_starting(server):
+    if os.environ.get("METRICS_DIR"):
+        import metrics
+        metrics.reset(os.environ["METRICS_DIR"])
+
+
+def child_exit(server, worker):
+    # Keeps a recycled worker's counts without leaving one file per worker
+    # ever started.
+    if os.environ.get("METRICS_DIR"):
+        import metrics
+        metrics.retire(os.environ["METRICS_DIR"], worker.pid)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
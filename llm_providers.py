@@ -0,0 +1,539 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CPRS_TYPES = ["Foundation", "Definition", "Differentiation", "Scenario", "Anti-Confusion", "Compression"]
+
+
+class LLMProviderError(Exception):
+    pass
+
+
+class CircuitOpenError(LLMProviderError):
+    pass
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key, model="gpt-4o", base_url=None, connect_timeout=5.0, read_timeout=60.0, max_connections=20,
+                 async_max_connections=256):
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+        self.model = model
+        self.async_max_connections = async_max_connections
+        self._async_client = None
+        # One pooled HTTP client per process; retries are handled by
+        # ResilientProvider so the SDK's own retry loop is disabled.
+        http_client = DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+        options = {"api_key": api_key, "http_client": http_client, "max_retries": 0}
+        if base_url:
+            options["base_url"] = base_url
+        self.client = OpenAI(**options)
+        self._client_options = options
+        self._timeouts = (connect_timeout, read_timeout)
+
+    @property
+    def async_client(self):
+        # Created on first use by the ASGI entry point so the sync-only
+        # deployments never open a second pool. An open connection costs a
+        # socket rather than a thread, so this pool is much larger.
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            connect_timeout, read_timeout = self._timeouts
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=self.async_max_connections,
+                                    max_keepalive_connections=self.async_max_connections),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+            )
+            self._async_client = AsyncOpenAI(**dict(self._client_options, http_client=http_client))
+        return self._async_client
+
+    def _options(self, timeout):
+        from openai import NOT_GIVEN
+        return {"timeout": timeout if timeout is not None else NOT_GIVEN}
+
+    @staticmethod
+    def _record_usage(usage, reported):
+        if usage is not None and reported is not None:
+            usage["prompt_tokens"] = reported.prompt_tokens or 0
+            usage["completion_tokens"] = reported.completion_tokens or 0
+
+    # `usage`, when given, is a dict that receives the prompt_tokens and
+    # completion_tokens the API reports for the call.
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=max_tokens,
+            **self._options(timeout)
+        )
+        self._record_usage(usage, response.usage)
+        return response.choices[0].message.content
+
+    async def acomplete(self, messages, max_tokens, timeout=None, usage=None):
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=max_tokens,
+            **self._options(timeout)
+        )
+        self._record_usage(usage, response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, messages, max_tokens, timeout=None, usage=None):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._options(timeout)
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            elif getattr(chunk, "usage", None) is not None:
+                self._record_usage(usage, chunk.usage)
+
+
+def _quoted_concept(prompt):
+    match = re.search(r'for: "([^"]+)"', prompt)
+    return match.group(1) if match else "Azure"
+
+
+def _review_text(prompt):
+    marker = 'Quiz review content:'
+    return prompt.split(marker, 1)[1] if marker in prompt else prompt
+
+
+def fake_cprs_payload(concept):
+    questions = []
+    for index, kind in enumerate(CPRS_TYPES):
+        questions.append({
+            "type": kind,
+            "question": f"{kind} question {index + 1} about {concept}?",
+            "options": {
+                "A": f"The correct statement about {concept}",
+                "B": f"A common misconception about {concept}",
+                "C": "A related but different Azure service",
+                "D": "An option that does not apply"
+            },
+            "correct": "A",
+            "explanation": f"Option A is the accurate description of {concept}."
+        })
+    return {"concept": concept, "questions": questions, "objective": "1.1"}
+
+
+def fake_extract_payload(review_text, concept_finder=None):
+    names = concept_finder(review_text) if concept_finder else []
+    concepts = [{
+        "name": name,
+        "foundation": f"{name} solves a specific Azure administration problem.",
+        "definition": f"{name} is an Azure capability covered by AZ-104.",
+        "differentiation": f"{name} differs from similarly named services.",
+        "correct_fact": f"{name} is configured per resource scope.",
+        "why_wrong": f"The chosen answer confused {name} with another service.",
+        "compression": f"Remember {name} by its scope.",
+        "objective": "1.1"
+    } for name in names]
+    return {
+        "concepts": concepts,
+        "summary": f"Review {len(concepts)} weak concept(s) using the CPRS structure."
+    }
+
+
+class FakeProvider:
+    # Deterministic stand-in that returns schema-valid CPRS and concept JSON
+    # without network access. Latency and failure rate are injectable so the
+    # Flask layer can be load-tested on its own.
+    name = "fake"
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None, concept_finder=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.concept_finder = concept_finder
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _usage(self, usage, messages, text):
+        # Roughly four characters per token, close enough for load tests.
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(m["content"]) for m in messages) // 4
+            usage["completion_tokens"] = len(text) // 4
+
+    def _payload(self, messages, fail=None):
+        if fail is None:
+            fail = self._roll()
+            if self.latency:
+                time.sleep(self.latency)
+        if fail:
+            raise LLMProviderError("Injected failure from fake LLM provider")
+        prompt = messages[-1]["content"]
+        if 'Weak concepts:' in prompt:
+            weak = prompt.split('Weak concepts:', 1)[1].count('\n- ')
+            return {"summary": f"Focus on {weak} weak concept(s) using the CPRS structure."}
+        if 'Quiz review content:' in prompt:
+            return fake_extract_payload(_review_text(prompt), self.concept_finder)
+        return fake_cprs_payload(_quoted_concept(prompt))
+
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        text = json.dumps(self._payload(messages))
+        self._usage(usage, messages, text)
+        return text
+
+    async def acomplete(self, messages, max_tokens, timeout=None, usage=None):
+        fail = self._roll()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = json.dumps(self._payload(messages, fail))
+        self._usage(usage, messages, text)
+        return text
+
+    def stream(self, messages, max_tokens, timeout=None, usage=None):
+        text = json.dumps(self._payload(messages), indent=2)
+        for start in range(0, len(text), 64):
+            yield text[start:start + 64]
+        self._usage(usage, messages, text)
+
+
+def is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, LLMProviderError):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class RetryBudget:
+    # Every call deposits `ratio` tokens and every retry withdraws one, so
+    # retries stay a bounded fraction of traffic during an upstream incident
+    # instead of multiplying load.
+    def __init__(self, ratio=0.2, min_tokens=3.0, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class ResilientProvider:
+    # Wraps a provider with jittered exponential retries drawn from a shared
+    # RetryBudget and a CircuitBreaker that fails fast (so handlers return
+    # their fallback payload immediately) while the upstream is unhealthy.
+    def __init__(self, provider, max_retries=2, backoff_base=0.5, backoff_cap=4.0, budget=None, breaker=None):
+        self.provider = provider
+        self.name = provider.name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0, "retries": 0, "budget_exhausted": 0, "short_circuited": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _begin(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("LLM upstream unhealthy - circuit open")
+        self._count("calls")
+        self.budget.deposit()
+
+    def _backoff(self, error, attempt):
+        # Seconds to wait before retrying after `error`, or None when the
+        # error should be raised to the caller.
+        if not is_retryable(error):
+            self.breaker.record_success()
+            return None
+        if attempt >= self.max_retries or not self.budget.withdraw():
+            if attempt < self.max_retries:
+                self._count("budget_exhausted")
+            self._count("failures")
+            self.breaker.record_failure()
+            return None
+        self._count("retries")
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt + 1)))
+
+    def _call(self, fn):
+        self._begin()
+        attempt = 0
+        while True:
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _acall(self, fn):
+        # Same policy as _call for coroutine functions; the backoff sleeps
+        # without holding a thread.
+        self._begin()
+        attempt = 0
+        while True:
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        return self._call(lambda: self.provider.complete(messages, max_tokens, timeout=timeout, usage=usage))
+
+    async def acomplete(self, messages, max_tokens, timeout=None, usage=None):
+        return await self._acall(lambda: self.provider.acomplete(messages, max_tokens, timeout=timeout, usage=usage))
+
+    def stream(self, messages, max_tokens, timeout=None, usage=None):
+        # Only the connection is retried; once tokens have been yielded a
+        # failure is surfaced to the caller.
+        return self._call(lambda: _first_chunk(self.provider.stream(messages, max_tokens, timeout=timeout, usage=usage)))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters.update({
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_tokens": round(self.budget.tokens, 2)
+        })
+        return counters
+
+
+def _first_chunk(iterator):
+    first = next(iterator, None)
+
+    def chained():
+        if first is not None:
+            yield first
+        yield from iterator
+    return chained()
+
+
+def provider_from_env(concept_finder=None):
+    kind = os.environ.get("LLM_PROVIDER", "openai")
+    if kind == "fake":
+        return FakeProvider(
+            latency=float(os.environ.get("FAKE_LLM_LATENCY", "0")),
+            failure_rate=float(os.environ.get("FAKE_LLM_FAILURE_RATE", "0")),
+            concept_finder=concept_finder
+        )
+    if kind != "openai":
+        raise ValueError(f"Unknown LLM_PROVIDER {kind!r}")
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    return OpenAIProvider(
+        api_key,
+        model=os.environ.get("LLM_MODEL", "gpt-4o"),
+        base_url=os.environ.get("OPENAI_BASE_URL"),
+        connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.environ.get("LLM_READ_TIMEOUT", "60")),
+        max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "20")),
+        async_max_connections=int(os.environ.get("LLM_ASYNC_MAX_CONNECTIONS", "256"))
+    )
+
+
+def resilient_from_env(provider):
+    if provider is None:
+        return None
+    return ResilientProvider(
+        provider,
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+        budget=RetryBudget(ratio=float(os.environ.get("LLM_RETRY_BUDGET_RATIO", "0.2"))),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("LLM_BREAKER_THRESHOLD", "5")),
+            cooldown=float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+        )
+    )
+
+
+def make_mock_handler(provider):
+    class MockOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            messages = body.get("messages", [])
+            model = body.get("model", "gpt-4o")
+            created = int(time.time())
+            usage = {}
+            try:
+                if body.get("stream"):
+                    chunks = list(provider.stream(messages, body.get("max_tokens", 0), usage=usage))
+                else:
+                    content = provider.complete(messages, body.get("max_tokens", 0), usage=usage)
+            except LLMProviderError as e:
+                self._send_json(500, {"error": {"message": str(e), "type": "server_error"}})
+                return
+
+            if not body.get("stream"):
+                self._send_json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": dict(usage, total_tokens=sum(usage.values()))
+                })
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for piece in chunks + [None]:
+                delta = {"content": piece} if piece is not None else {}
+                event = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None if piece is not None else "stop"}]
+                }
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": dict(usage, total_tokens=sum(usage.values()))
+                }
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return MockOpenAIHandler
+
+
+def serve_mock(host, port, provider):
+    server = ThreadingHTTPServer((host, port), make_mock_handler(provider))
+    print(f"Mock OpenAI API on http://{host}:{port}/v1 (set OPENAI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions API backed by the fake provider.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated model latency per call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls that return HTTP 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from server import extract_concepts_from_text
+    provider = FakeProvider(args.latency, args.failure_rate, args.seed, concept_finder=extract_concepts_from_text)
+    serve_mock(args.host, args.port, provider)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
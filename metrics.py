@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import glob
+import atexit
+import bisect
+import argparse
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Prometheus text exposition (format 0.0.4) for counters and histograms.
+# Observing is a dict lookup and a few additions under a per-metric lock, so
+# instrumentation costs about a microsecond per call.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 120.0)
+BYTE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608, 33554432)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SNAPSHOT_PREFIX = 'metrics-'
+RETIRED_NAME = 'metrics-retired.json'
+LOCK_NAME = '.lock'
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return dict(self.series)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last slot is +Inf), sum, count]
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.series.get(labels)
+            if entry is None:
+                entry = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def state(self):
+        with self._lock:
+            return {labels: [list(counts), total, count] for labels, (counts, total, count) in self.series.items()}
+
+
+class Registry:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(f"{self.namespace}_{name}", help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(f"{self.namespace}_{name}", help, labelnames, buckets))
+
+    def snapshot(self):
+        # {name: {kind, help, labelnames, buckets, series: {labels: value}}}
+        return {metric.name: {
+            "kind": metric.kind,
+            "help": metric.help,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "series": metric.state()
+        } for metric in self.metrics}
+
+
+def merge_snapshots(snapshots):
+    # Adds counters and histogram buckets across processes. Series are keyed
+    # by label values, so the result is what one process would have seen.
+    merged = {}
+    for snapshot in snapshots:
+        for name, entry in snapshot.items():
+            target = merged.setdefault(name, dict(entry, series={}))
+            for labels, value in entry["series"].items():
+                current = target["series"].get(labels)
+                if current is None:
+                    target["series"][labels] = value if entry["kind"] == "counter" else [list(value[0]), value[1], value[2]]
+                elif entry["kind"] == "counter":
+                    target["series"][labels] = current + value
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    lines = []
+    for name, entry in snapshot.items():
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['kind']}")
+        names = entry["labelnames"]
+        for labels, value in sorted(entry["series"].items()):
+            if entry["kind"] == "counter":
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket in zip(list(entry["buckets"]) + ["+Inf"], counts):
+                cumulative += bucket
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(names, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def histogram_quantile(buckets, counts, q):
+    # Linear interpolation inside the bucket holding the q-th observation,
+    # as Prometheus' histogram_quantile() does. Observations above the last
+    # bound report the last bound.
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, bucket in enumerate(counts):
+        if cumulative + bucket >= rank and bucket:
+            if index == len(buckets):
+                return buckets[-1]
+            lower = buckets[index - 1] if index else 0.0
+            return lower + (buckets[index] - lower) * (rank - cumulative) / bucket
+        cumulative += bucket
+    return buckets[-1]
+
+
+def histogram_summary(entry, quantiles=(0.5, 0.95, 0.99)):
+    # One row per label set: count, mean and the requested quantiles.
+    rows = []
+    for labels, (counts, total, count) in sorted(entry["series"].items()):
+        row = dict(zip(entry["labelnames"], labels))
+        row["count"] = count
+        row["mean"] = round(total / count, 6) if count else None
+        for q in quantiles:
+            value = histogram_quantile(entry["buckets"], counts, q)
+            row[f"p{round(q * 100):d}"] = round(value, 6) if value is not None else None
+        rows.append(row)
+    return rows
+
+
+def _to_json(snapshot):
+    return {name: dict(entry, series=[[list(labels), value] for labels, value in entry["series"].items()])
+            for name, entry in snapshot.items()}
+
+
+def _from_json(data):
+    return {name: dict(entry, series={tuple(labels): value for labels, value in entry["series"]})
+            for name, entry in data.items()}
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r') as f:
+            return _from_json(json.load(f))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_snapshot(path, snapshot):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(_to_json(snapshot), f)
+    os.replace(tmp, path)
+
+
+class _DirectoryLock:
+    def __init__(self, directory, exclusive):
+        self.path = os.path.join(directory, LOCK_NAME)
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        self.handle = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        self.handle.close()
+
+
+class SharedMetrics:
+    # Combines the registries of several worker processes. Each process
+    # writes its snapshot to `<directory>/metrics-<pid>.json` every
+    # `interval` seconds and at exit; a scrape adds the live local registry
+    # to every other process's last snapshot, so /metrics reports the same
+    # totals whichever worker answers. Snapshots of exited workers are folded
+    # into metrics-retired.json (see `retire`) so counters never go backwards
+    # when workers are recycled.
+    def __init__(self, registry, directory, interval=5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{self.pid}.json")
+        os.makedirs(directory, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            _write_snapshot(self.path, self.registry.snapshot())
+        except OSError:
+            pass
+
+    def close(self):
+        self._stop.set()
+        self.write()
+
+    def snapshot(self):
+        others = []
+        with _DirectoryLock(self.directory, exclusive=False):
+            for path in glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}*.json")):
+                if path != self.path:
+                    others.append(_read_snapshot(path))
+        return merge_snapshots(others + [self.registry.snapshot()])
+
+
+def retire(directory, pid):
+    # Folds an exited worker's final snapshot into metrics-retired.json.
+    path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{pid}.json")
+    if not os.path.exists(path):
+        return
+    retired = os.path.join(directory, RETIRED_NAME)
+    with _DirectoryLock(directory, exclusive=True):
+        merged = merge_snapshots([_read_snapshot(retired), _read_snapshot(path)])
+        _write_snapshot(retired, merged)
+        os.remove(path)
+
+
+def reset(directory):
+    # Clears snapshots left by a previous run of the server.
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, f"{SNAPSHOT_PREFIX}*.json")):
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize latency histograms from a /metrics scrape.")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.environ.get('PORT', '5000')}/api/admin/metrics")
+    parser.add_argument("--token", default=os.environ.get("ADMIN_TOKEN"))
+    args = parser.parse_args(argv)
+
+    import urllib.request
+    req = urllib.request.Request(args.url, headers={"X-Admin-Token": args.token or ""})
+    with urllib.request.urlopen(req, timeout=10) as response:
+        summary = json.load(response)
+    for name, rows in summary.items():
+        print(name)
+        for row in rows:
+            labels = " ".join(f"{k}={v}" for k, v in row.items() if k not in ("count", "mean", "p50", "p95", "p99"))
+            print(f"  {labels:60} n={row['count']:<8} p50={row['p50']} p95={row['p95']} p99={row['p99']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
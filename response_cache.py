@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def content_key(namespace, text):
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{namespace}-{digest}"
+
+
+class ResponseCache:
+    # Two tiers: a bounded in-process LRU in front of one JSON file per key on
+    # disk, so entries survive restarts and are shared by every worker that
+    # points at the same directory.
+    def __init__(self, disk_dir, max_entries=512, ttl_seconds=7 * 24 * 3600):
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "expired": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[-2:], f"{key}.json")
+
+    def _remember(self, key, stored_at, value):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+                self.counters["expired"] += 1
+
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                record = None
+            if record is not None:
+                if now - record.get("storedAt", 0) < self.ttl_seconds:
+                    with self._lock:
+                        self._remember(key, record["storedAt"], record["value"])
+                        self.counters["disk_hits"] += 1
+                    return record["value"]
+                self._count("expired")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        self._count("misses")
+        return None
+
+    def put(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, value)
+            self.counters["writes"] += 1
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"storedAt": stored_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def purge(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        disk_removed = 0
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for root, _, files in os.walk(self.disk_dir):
+                for name in files:
+                    try:
+                        os.remove(os.path.join(root, name))
+                        disk_removed += 1
+                    except OSError:
+                        pass
+        return {"memory": removed, "disk": disk_removed}
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        counters.update({
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        })
+        return counters
@@ -1,19 +1,134 @@
 import os
+import gzip
 import json
 import re
+import string
+import math
+import time
 import uuid
-from flask import Flask, send_from_directory, request, jsonify
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from flask import Flask, Response, send_from_directory, request, jsonify, stream_with_context, g
 from flask_cors import CORS
-from openai import OpenAI
+from response_cache import ResponseCache, content_key
+from cprs_bank import CprsBank
+from single_flight import SingleFlight, AsyncSingleFlight
+from analytics import ObjectiveAnalytics
+from static_assets import StaticSite
+from llm_providers import provider_from_env, resilient_from_env, CircuitOpenError
+from metrics import Registry, SharedMetrics, render as render_metrics, histogram_summary, LLM_BUCKETS, BYTE_BUCKETS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from content_codecs import negotiate_encoding, compress_body, decompress_body, CompressionError, UnsupportedEncoding, MIN_COMPRESS_BYTES
+from sync_store import sync_store_from_env, sync_store_layers, export_ndjson, import_ndjson, gzip_stream, valid_user_id, apply_merge_patch, apply_ops, merge_sync_documents, PatchError, VersionConflict, StoreUnavailable, ANY_VERSION
 
 app = Flask(__name__, static_folder='docs')
-CORS(app)
+CORS(app, expose_headers=['ETag', 'Content-Encoding'])
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 SYNC_DATA_DIR = os.path.join(os.path.dirname(__file__), '.sync_data')
 os.makedirs(SYNC_DATA_DIR, exist_ok=True)
+SYNC_HISTORY_MAX = int(os.environ.get("SYNC_HISTORY_MAX", "30"))
+SYNC_MAX_BODY_BYTES = int(os.environ.get("SYNC_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+static_site = StaticSite(
+    app.static_folder,
+    os.environ.get("STATIC_BUILD_DIR", os.path.join(os.path.dirname(__file__), '.static_build'))
+)
+
+EXTRACT_BATCH_MAX_ITEMS = int(os.environ.get("EXTRACT_BATCH_MAX_ITEMS", "100"))
+EXTRACT_BATCH_CONCURRENCY = int(os.environ.get("EXTRACT_BATCH_CONCURRENCY", "8"))
+EXTRACT_BATCH_ITEM_TIMEOUT = float(os.environ.get("EXTRACT_BATCH_ITEM_TIMEOUT", "30"))
+EXTRACT_CHUNK_CHARS = int(os.environ.get("EXTRACT_CHUNK_CHARS", "4000"))
+EXTRACT_MAX_CHUNKS = int(os.environ.get("EXTRACT_MAX_CHUNKS", "16"))
+EXTRACT_CHUNK_CONCURRENCY = int(os.environ.get("EXTRACT_CHUNK_CONCURRENCY", "8"))
+# Process-wide cap on the LLM calls fanned out by chunked reviews and batch
+# items together, so a batch of long reviews cannot multiply the two limits
+# above. Slots are held only for the model call itself, never while waiting
+# on other work, so nested fan-out cannot deadlock.
+EXTRACT_FANOUT_CONCURRENCY = int(os.environ.get("EXTRACT_FANOUT_CONCURRENCY", "8"))
+extract_fanout_slots = threading.BoundedSemaphore(max(1, EXTRACT_FANOUT_CONCURRENCY))
+
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join(os.path.dirname(__file__), '.llm_cache'))
+extract_cache = ResponseCache(
+    os.path.join(LLM_CACHE_DIR, 'extract-concepts'),
+    max_entries=int(os.environ.get("EXTRACT_CACHE_SIZE", "512")),
+    ttl_seconds=int(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+)
+
+CPRS_BANK_PATH = os.environ.get("CPRS_BANK_PATH", os.path.join(os.path.dirname(__file__), '.cprs_bank.sqlite3'))
+cprs_bank = CprsBank(CPRS_BANK_PATH)
+
+llm_flight = SingleFlight()
+llm_async_flight = AsyncSingleFlight()
+
+STARTED_AT = time.time()
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+metrics = Registry('az104')
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', 'Time until the response headers are ready, by route and status.',
+    ('route', 'method', 'status'))
+http_request_size = metrics.histogram(
+    'http_request_size_bytes', 'Request body size by route.', ('route',), BYTE_BUCKETS)
+http_response_size = metrics.histogram(
+    'http_response_size_bytes', 'Response body size by route (streamed responses are not counted).', ('route',), BYTE_BUCKETS)
+llm_call_duration = metrics.histogram(
+    'llm_call_duration_seconds', 'LLM call time including retries, by endpoint and outcome.', ('endpoint', 'outcome'), LLM_BUCKETS)
+llm_tokens = metrics.counter(
+    'llm_tokens_total', 'Tokens reported by the LLM API, by endpoint and kind.', ('endpoint', 'kind'))
+fallback_responses = metrics.counter(
+    'fallback_responses_total', 'Responses served in fallback mode, by endpoint and reason.', ('endpoint', 'reason'))
+sync_operation_duration = metrics.histogram(
+    'sync_operation_duration_seconds', 'Sync store operation time as seen by the handlers.', ('operation',))
+# Set by gunicorn.conf.py when several worker processes share one /metrics.
+shared_metrics = SharedMetrics(metrics, os.environ["METRICS_DIR"]) if os.environ.get("METRICS_DIR") else None
+
+def record_request(route, method, status, seconds, request_bytes, response_bytes):
+    http_request_duration.observe(seconds, route, method, str(status))
+    if request_bytes:
+        http_request_size.observe(request_bytes, route)
+    if response_bytes is not None:
+        http_response_size.observe(response_bytes, route)
+
+def record_llm_call(endpoint, outcome, seconds, usage):
+    llm_call_duration.observe(seconds, endpoint, outcome)
+    for kind in ('prompt', 'completion'):
+        if usage.get(f'{kind}_tokens'):
+            llm_tokens.inc(endpoint, kind, amount=usage[f'{kind}_tokens'])
+
+def failure_reason(error):
+    return 'circuit_open' if isinstance(error, CircuitOpenError) else 'error'
+
+def llm_complete(provider, endpoint, messages, max_tokens, timeout=None):
+    usage = {}
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        return provider.complete(messages, max_tokens=max_tokens, timeout=timeout, usage=usage)
+    except Exception as e:
+        outcome = failure_reason(e)
+        raise
+    finally:
+        record_llm_call(endpoint, outcome, time.perf_counter() - start, usage)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(route, request.method, response.status_code, time.perf_counter() - started,
+                       request.content_length, response.content_length)
+    return response
+
+def admin_authorized():
+    if not ADMIN_TOKEN:
+        return False
+    return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
 
 AZ104_OBJECTIVES = {
     "domains": [
@@ -70,10 +185,75 @@ AZ104_OBJECTIVES = {
     ]
 }
 
+objective_analytics = ObjectiveAnalytics(
+    os.environ.get("ANALYTICS_DB_PATH", os.path.join(SYNC_DATA_DIR, 'analytics.sqlite3')),
+    AZ104_OBJECTIVES
+)
+sync_store = sync_store_from_env(SYNC_DATA_DIR, observer=objective_analytics, timer=sync_operation_duration)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness plus a cheap readiness probe of the sync store (an indexed
+    # lookup). The LLM circuit state is reported but does not fail the
+    # check, since handlers fall back when the provider is down.
+    checks = {}
+    healthy = True
+    try:
+        sync_store.version('__healthz__')
+        checks["sync_store"] = "ok"
+    except Exception as e:
+        checks["sync_store"] = f"error: {e}"
+        healthy = False
+    if llm_provider:
+        checks["llm"] = llm_provider.stats()["circuit"]
+    else:
+        checks["llm"] = "not configured"
+    response = jsonify({
+        "status": "ok" if healthy else "unavailable",
+        "checks": checks,
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - STARTED_AT, 1)
+    })
+    response.status_code = 200 if healthy else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def metrics_snapshot():
+    return shared_metrics.snapshot() if shared_metrics else metrics.snapshot()
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus scrape target. With METRICS_TOKEN set, scrapers must send
+    # it as a bearer token.
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({"error": "Metrics token required"}), 401
+    return Response(render_metrics(metrics_snapshot()), content_type=METRICS_CONTENT_TYPE,
+                    headers={'Cache-Control': 'no-store'})
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def get_metrics_summary():
+    # p50/p95/p99 estimated from each latency histogram's buckets, the same
+    # way Prometheus' histogram_quantile() would.
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    snapshot = metrics_snapshot()
+    return jsonify({name: histogram_summary(entry) for name, entry in snapshot.items() if entry["kind"] == "histogram"})
+
 @app.route('/api/objectives', methods=['GET'])
 def get_objectives():
     return jsonify(AZ104_OBJECTIVES)
 
+@app.route('/api/analytics/objectives', methods=['GET'])
+def get_objective_analytics():
+    # Served from the incrementally maintained counters: a read of one small
+    # table, independent of the number of users.
+    try:
+        response = jsonify(objective_analytics.report())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 GUIDE_INDEX = {
     "Azure AD": {"file": "azure_ad_overview.html", "section": "Azure Active Directory"},
     "Entra ID": {"file": "azure_ad_overview.html", "section": "Microsoft Entra ID"},
@@ -107,67 +287,246 @@ GUIDE_INDEX = {
     "Azure Alerts": {"file": "azure_alerts_guide.html", "section": "Alerts"},
 }
 
+GUIDE_ALIASES = {
+    "Azure AD": ["AAD", "Azure Active Directory"],
+    "Entra ID": ["Microsoft Entra ID", "Entra"],
+    "RBAC": ["Role-Based Access Control", "Azure RBAC", "Role Assignments"],
+    "Azure Policy": ["Policy Initiative"],
+    "Management Groups": ["Management Group"],
+    "Storage Accounts": ["Storage Account"],
+    "Blob Storage": ["Blob", "Blobs"],
+    "Azure Files": ["File Share", "File Shares", "File Sync"],
+    "Storage Replication": ["LRS", "ZRS", "GRS", "GZRS", "RA-GRS"],
+    "Virtual Machines": ["VM", "VMs"],
+    "VM Scale Sets": ["VMSS", "Virtual Machine Scale Sets", "Scale Sets"],
+    "Azure App Service": ["App Service", "App Service Plan", "Web App", "Deployment Slots"],
+    "Azure Container Instances": ["ACI", "Container Instances"],
+    "Azure Kubernetes Service": ["AKS", "Kubernetes"],
+    "Virtual Networks": ["VNet", "VNets", "Subnets"],
+    "VNet Peering": ["Peering"],
+    "Network Security Groups": ["NSG", "NSGs", "Application Security Groups", "ASG"],
+    "Azure Load Balancer": ["Load Balancer", "ALB"],
+    "Application Gateway": ["App Gateway", "AppGW", "WAF"],
+    "Azure DNS": ["DNS", "Private DNS Zones"],
+    "VPN Gateway": ["Site-to-Site VPN", "Point-to-Site VPN"],
+    "Azure Monitor": ["Metrics", "Diagnostic Settings", "VM Insights"],
+    "Log Analytics": ["Log Analytics Workspace", "KQL"],
+    "Azure Backup": ["Recovery Services Vault", "Backup Vault", "Backup Policy"],
+    "Azure Site Recovery": ["ASR", "Site Recovery"],
+    "Azure Alerts": ["Alerts", "Action Groups", "Alert Rules"],
+}
+
+_GENERIC_TOKENS = {"azure", "microsoft"}
+GUIDE_MEMO_SIZE = 4096
+
+def _alias_tokens(text):
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', text.lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        if token not in _GENERIC_TOKENS:
+            tokens.append(token)
+    return tuple(tokens)
+
+def guide_fingerprint(guide_index, aliases):
+    # Everything the alias index is built from: guide keys in order and
+    # their aliases. Editing either in place changes it, even when the
+    # number of guides stays the same.
+    return hash(tuple((key, tuple(aliases.get(key, ()))) for key in guide_index))
+
+class GuideAliasIndex:
+    # Inverted index from alias tokens to GUIDE_INDEX keys. Exact aliases
+    # resolve with one dict lookup; anything else is ranked over the guides
+    # sharing a token, so cost is independent of the number of guides.
+    def __init__(self, guide_index, aliases):
+        self.fingerprint = guide_fingerprint(guide_index, aliases)
+        self.exact = {}
+        self.postings = {}
+        self.entries = []
+        self.memo = {}
+        for order, key in enumerate(guide_index):
+            for name in [key] + list(aliases.get(key, [])):
+                tokens = _alias_tokens(name)
+                if not tokens:
+                    continue
+                entry_id = len(self.entries)
+                self.entries.append((key, frozenset(tokens), len(tokens), order))
+                self.exact.setdefault(tokens, key)
+                for token in set(tokens):
+                    self.postings.setdefault(token, []).append(entry_id)
+
+    def resolve(self, concept):
+        tokens = _alias_tokens(concept)
+        if not tokens:
+            return None
+        if tokens in self.exact:
+            return self.exact[tokens]
+        if tokens in self.memo:
+            return self.memo[tokens]
+        concept_tokens = frozenset(tokens)
+        best = None
+        best_rank = None
+        seen = set()
+        for token in concept_tokens:
+            for entry_id in self.postings.get(token, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                key, alias_tokens, alias_len, order = self.entries[entry_id]
+                if not (alias_tokens <= concept_tokens or concept_tokens <= alias_tokens):
+                    continue
+                # Most shared tokens wins, then the tightest alias, then
+                # GUIDE_INDEX order, so ties never depend on iteration order.
+                rank = (-len(alias_tokens & concept_tokens), abs(alias_len - len(concept_tokens)), order)
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = key, rank
+        if len(self.memo) >= GUIDE_MEMO_SIZE:
+            self.memo.clear()
+        self.memo[tokens] = best
+        return best
+
+_guide_alias_index = None
+
+def rebuild_guide_index():
+    global _guide_alias_index
+    _guide_alias_index = GuideAliasIndex(GUIDE_INDEX, GUIDE_ALIASES)
+    return _guide_alias_index
+
+def register_guide(key, file, section, aliases=()):
+    GUIDE_INDEX[key] = {"file": file, "section": section}
+    if aliases:
+        GUIDE_ALIASES[key] = list(aliases)
+    rebuild_guide_index()
+
+rebuild_guide_index()
+
 def find_guide_references(concepts):
+    index = _guide_alias_index
+    if index.fingerprint != guide_fingerprint(GUIDE_INDEX, GUIDE_ALIASES):
+        index = rebuild_guide_index()
     refs = []
     for concept in concepts:
-        concept_lower = concept.lower()
-        for key, value in GUIDE_INDEX.items():
-            if key.lower() in concept_lower or concept_lower in key.lower():
-                refs.append({
-                    "concept": concept,
-                    "guide": value["file"],
-                    "section": value["section"]
-                })
-                break
+        key = index.resolve(concept)
+        if key is None or key not in GUIDE_INDEX:
+            continue
+        value = GUIDE_INDEX[key]
+        refs.append({
+            "concept": concept,
+            "guide": value["file"],
+            "section": value["section"]
+        })
     return refs
 
+AZURE_KEYWORDS = [
+    "Azure AD", "Entra ID", "RBAC", "Azure Policy", "Management Groups",
+    "Subscriptions", "Resource Groups", "Storage Accounts", "Blob Storage",
+    "Azure Files", "File Sync", "Storage Replication", "LRS", "ZRS", "GRS",
+    "Virtual Machines", "VM Scale Sets", "Availability Sets", "Availability Zones",
+    "App Service", "Container Instances", "ACI", "Kubernetes", "AKS",
+    "Virtual Networks", "VNet", "VNet Peering", "NSG", "Network Security Groups",
+    "Load Balancer", "Application Gateway", "Azure DNS", "VPN Gateway",
+    "ExpressRoute", "Azure Monitor", "Log Analytics", "Azure Backup",
+    "Site Recovery", "Alerts", "Action Groups", "Metrics", "Diagnostic Settings",
+    "ARM Templates", "Bicep", "Azure CLI", "PowerShell", "Cloud Shell",
+    "Service Principal", "Managed Identity", "Key Vault", "SAS Token",
+    "Access Tier", "Hot", "Cool", "Archive", "Lifecycle Management",
+    "Private Endpoints", "Service Endpoints", "Azure Firewall", "WAF",
+    "Traffic Manager", "Front Door", "CDN", "Azure Bastion"
+]
+
+def _trie_pattern(node):
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if '' in node:
+        # Tried after the longer keywords that continue from here.
+        branches.append(node[''])
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+# What may follow a keyword: "es" plurals only after s/x/z/ch/sh ("Accesses",
+# "Boxes"), a plain "s" otherwise ("VNets", "ACIs"), so "ACIes" and "hotes"
+# are not read as plurals.
+_SIBILANT_PLURAL = r'(?=(?:es)?(?![a-z0-9]))'
+_PLAIN_PLURAL = r'(?=s?(?![a-z0-9]))'
+
+def _keyword_regex(keywords):
+    # Alternation factored into a prefix trie so each text position is tested
+    # against at most one branch per character, however long the keyword list.
+    # The pattern runs over lowercased text with a space prepended and opens
+    # by consuming the non-alphanumeric character before the keyword: a
+    # leading character class lets the regex engine skip over the letters of
+    # ordinary words instead of attempting a match at every position, which
+    # is about four times faster than a lookbehind under re.IGNORECASE. Each
+    # keyword ends in a lookahead for the plural its spelling allows, which
+    # the trailing group then consumes; "hotfix" still does not match "Hot".
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        lowered = keyword.lower()
+        for ch in lowered:
+            node = node.setdefault(ch, {})
+        node[''] = _SIBILANT_PLURAL if lowered.endswith(('s', 'x', 'z', 'ch', 'sh')) else _PLAIN_PLURAL
+    return re.compile(r'[^a-z0-9](' + _trie_pattern(trie) + r')(?:e?s)?(?![a-z0-9])')
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _keyword_haystack(text):
+    # Offsets into the result are one past the matching offsets in `text`.
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few non-ASCII characters lowercase to several code points, which
+        # would shift match offsets; fold ASCII only for such texts.
+        lowered = text.translate(_ASCII_LOWER)
+    return ' ' + lowered
+
+def build_keyword_matcher(keywords):
+    # Keywords nested inside a longer one ("VNet" in "VNet Peering") come from
+    # a precomputed table so one non-overlapping pass still reports them all.
+    lookup = {k.lower(): k for k in keywords}
+    pattern = _keyword_regex(keywords)
+    nested = {}
+    for keyword in keywords:
+        inner = [k for k in keywords if k != keyword and len(k) < len(keyword)]
+        hits = [
+            (lookup[m.group(1)], m.start(1) - 1, m.end() - 1)
+            for m in _keyword_regex(inner).finditer(_keyword_haystack(keyword))
+        ] if inner else []
+        if hits:
+            nested[keyword] = hits
+    return pattern, lookup, nested
+
+_KEYWORD_PATTERN, _KEYWORD_LOOKUP, _NESTED_KEYWORDS = build_keyword_matcher(AZURE_KEYWORDS)
+
+def find_concept_matches(text):
+    matches = []
+    for m in _KEYWORD_PATTERN.finditer(_keyword_haystack(text)):
+        keyword = _KEYWORD_LOOKUP[m.group(1)]
+        offset = m.start(1) - 1
+        matches.append({"concept": keyword, "start": offset, "end": m.end() - 1})
+        for inner, start, end in _NESTED_KEYWORDS.get(keyword, ()):
+            matches.append({"concept": inner, "start": offset + start, "end": offset + end})
+    matches.sort(key=lambda match: (match["start"], match["end"]))
+    return matches
+
 def extract_concepts_from_text(text):
-    azure_keywords = [
-        "Azure AD", "Entra ID", "RBAC", "Azure Policy", "Management Groups",
-        "Subscriptions", "Resource Groups", "Storage Accounts", "Blob Storage",
-        "Azure Files", "File Sync", "Storage Replication", "LRS", "ZRS", "GRS",
-        "Virtual Machines", "VM Scale Sets", "Availability Sets", "Availability Zones",
-        "App Service", "Container Instances", "ACI", "Kubernetes", "AKS",
-        "Virtual Networks", "VNet", "VNet Peering", "NSG", "Network Security Groups",
-        "Load Balancer", "Application Gateway", "Azure DNS", "VPN Gateway",
-        "ExpressRoute", "Azure Monitor", "Log Analytics", "Azure Backup",
-        "Site Recovery", "Alerts", "Action Groups", "Metrics", "Diagnostic Settings",
-        "ARM Templates", "Bicep", "Azure CLI", "PowerShell", "Cloud Shell",
-        "Service Principal", "Managed Identity", "Key Vault", "SAS Token",
-        "Access Tier", "Hot", "Cool", "Archive", "Lifecycle Management",
-        "Private Endpoints", "Service Endpoints", "Azure Firewall", "WAF",
-        "Traffic Manager", "Front Door", "CDN", "Azure Bastion"
-    ]
-    
-    found = []
-    text_lower = text.lower()
-    for keyword in azure_keywords:
-        if keyword.lower() in text_lower:
-            found.append(keyword)
-    return list(set(found))
+    found = {}
+    for name in _KEYWORD_PATTERN.findall(' ' + text.lower()):
+        keyword = _KEYWORD_LOOKUP[name]
+        if keyword not in found:
+            found[keyword] = None
+            for inner, _, _ in _NESTED_KEYWORDS.get(keyword, ()):
+                found.setdefault(inner, None)
+    return list(found)
 
-@app.route('/api/extract-concepts', methods=['POST'])
-def extract_concepts():
-    data = request.get_json()
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    
-    raw_text = data['text']
-    local_concepts = extract_concepts_from_text(raw_text)
-    guide_refs = find_guide_references(local_concepts)
-    
-    if not openai_client:
-        return jsonify({
-            "fallback": True,
-            "fallback_reason": "OpenAI API key not configured",
-            "local_concepts": local_concepts,
-            "guide_references": guide_refs,
-            "concepts": [],
-            "summary": "AI analysis unavailable - using keyword extraction mode."
-        }), 200
-    
-    try:
-        prompt = f"""You are an Azure certification expert using the CPRS (Concept-Pathway Reinforcement System) methodology.
+llm_provider = resilient_from_env(provider_from_env(concept_finder=extract_concepts_from_text))
+
+def llm_provider_name():
+    # Part of the response cache and question bank keys, so output from one
+    # provider (the fake's placeholders in particular) is never served by a
+    # server using another. Without an API key the server still serves what
+    # OpenAI produced earlier.
+    return llm_provider.name if llm_provider else 'openai'
+
+def build_extract_prompt(raw_text):
+    return f"""You are an Azure certification expert using the CPRS (Concept-Pathway Reinforcement System) methodology.
 
 Analyze the following quiz review content where the student got questions wrong.
 
@@ -197,63 +556,272 @@ Format your response as JSON with this structure:
 }}
 
 Quiz review content:
-{raw_text[:4000]}"""
-
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an Azure certification expert who provides accurate, authoritative Azure facts for the AZ-104 exam. Always be precise and factual."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=2000
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        
-        all_concept_names = [c['name'] for c in result.get('concepts', [])]
-        all_concept_names.extend(local_concepts)
-        
-        guide_refs = find_guide_references(all_concept_names)
-        
-        result['guide_references'] = guide_refs
-        result['local_concepts'] = local_concepts
-        
-        return jsonify(result)
+{raw_text}"""
+
+EXTRACT_SYSTEM_PROMPT = "You are an Azure certification expert who provides accurate, authoritative Azure facts for the AZ-104 exam. Always be precise and factual."
+
+def extract_messages(raw_text):
+    return [
+        {"role": "system", "content": EXTRACT_SYSTEM_PROMPT},
+        {"role": "user", "content": build_extract_prompt(raw_text)}
+    ]
+
+def request_extract(provider, raw_text, timeout=None):
+    messages = extract_messages(raw_text)
+    key = content_key(f'extract-concepts-{provider.name}', messages[1]["content"])
+    return json.loads(llm_flight.do(key, lambda: llm_complete(provider, 'extract-concepts', messages, 2000, timeout)))
+
+def extract_fallback(local_concepts, guide_refs, error=None, reason=None):
+    fallback_responses.inc('extract-concepts', reason or ('unconfigured' if error is None else 'error'))
+    result = {
+        "fallback": True,
+        "local_concepts": local_concepts,
+        "guide_references": guide_refs,
+        "concepts": []
+    }
+    if error is None:
+        result["fallback_reason"] = "OpenAI API key not configured"
+        result["summary"] = "AI analysis unavailable - using keyword extraction mode."
+    else:
+        result["error"] = error
+        result["summary"] = "AI analysis failed - using keyword extraction mode."
+    return result
+
+QUESTION_BOUNDARY = re.compile(r'^[ \t]*(?:\d+[ \t]*[.)][ \t]*question\b|question[ \t]*\d+\b|q\d+[ \t]*[.:)])', re.IGNORECASE | re.MULTILINE)
+
+def split_review(raw_text, chunk_chars=None):
+    # Cut on question headers ("1. QUESTION", "Question 12:", "Q3.") and pack
+    # whole questions into chunks; a single oversized question is split on
+    # whitespace so no chunk exceeds the prompt budget.
+    chunk_chars = chunk_chars or EXTRACT_CHUNK_CHARS
+    starts = [m.start() for m in QUESTION_BOUNDARY.finditer(raw_text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    pieces = []
+    for start, end in zip(starts, starts[1:] + [len(raw_text)]):
+        piece = raw_text[start:end]
+        while len(piece) > chunk_chars:
+            cut = piece.rfind(' ', 0, chunk_chars)
+            cut = cut if cut > chunk_chars // 2 else chunk_chars
+            pieces.append(piece[:cut])
+            piece = piece[cut:]
+        pieces.append(piece)
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(piece) <= chunk_chars:
+            chunks[-1] += piece
+        else:
+            chunks.append(piece)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def merge_concepts(results):
+    concepts = {}
+    for result in results:
+        for concept in result.get('concepts', []):
+            name = concept.get('name', '').strip()
+            if name and name.lower() not in concepts:
+                concepts[name.lower()] = concept
+    return list(concepts.values())
+
+def build_summary_prompt(concepts):
+    lines = "\n".join(f"- {c['name']}: {c.get('why_wrong', '')}" for c in concepts)
+    return f"""Write a 2-3 sentence NotebookLM-ready summary using CPRS structure focusing on the weak areas below.
+
+Respond as JSON: {{"summary": "..."}}
+
+Weak concepts:
+{lines}"""
+
+def summary_messages(concepts):
+    return [
+        {"role": "system", "content": EXTRACT_SYSTEM_PROMPT},
+        {"role": "user", "content": build_summary_prompt(concepts)}
+    ]
+
+def request_summary(provider, concepts, chunk_summaries, timeout=None):
+    try:
+        return json.loads(llm_complete(provider, 'extract-summary', summary_messages(concepts), 300, timeout))['summary']
+    except Exception:
+        return " ".join(s for s in chunk_summaries if s)
+
+def fanout_call(fn, timeout=None):
+    # Runs fn in one of the shared fan-out slots, waiting at most `timeout`
+    # seconds for a slot, or for as long as it takes when timeout is None.
+    # (Semaphore.acquire treats a negative timeout as "do not wait".)
+    acquired = extract_fanout_slots.acquire() if timeout is None else extract_fanout_slots.acquire(timeout=timeout)
+    if not acquired:
+        raise TimeoutError("Timed out waiting for an extraction slot")
+    try:
+        return fn()
+    finally:
+        extract_fanout_slots.release()
+
+def merge_chunk_results(outcomes):
+    # outcomes holds one result dict or exception per chunk. Chunks that
+    # succeeded are merged; the first error is raised only if none did.
+    results = [o for o in outcomes if not isinstance(o, Exception)]
+    failed = len(outcomes) - len(results)
+    if not results:
+        raise next(o for o in outcomes if isinstance(o, Exception))
+    concepts = merge_concepts(results)
+    result = {"concepts": concepts}
+    if failed:
+        result['partial'] = True
+        result['failed_chunks'] = failed
+    return result, [r.get('summary', '') for r in results]
+
+def request_extract_chunked(provider, chunks, timeout=None):
+    def one(chunk):
+        try:
+            return fanout_call(lambda: request_extract(provider, chunk, timeout=timeout), timeout)
+        except Exception as e:
+            return e
+    
+    workers = max(1, min(EXTRACT_CHUNK_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(one, chunks))
+    result, summaries = merge_chunk_results(outcomes)
+    try:
+        result['summary'] = fanout_call(lambda: request_summary(provider, result['concepts'], summaries, timeout=timeout), timeout)
+    except TimeoutError:
+        result['summary'] = " ".join(s for s in summaries if s)
+    return result
+
+def plan_review(raw_text, local_concepts=None):
+    # Everything in analyze_review that runs before the model call, shared
+    # with the async handler in asgi.py. Returns (plan, response); response
+    # is the finished result when no model call is needed.
+    if local_concepts is None:
+        local_concepts = extract_concepts_from_text(raw_text)
+    guide_refs = find_guide_references(local_concepts)
+    
+    chunks = split_review(raw_text)
+    plan = {
+        "raw_text": raw_text,
+        "local_concepts": local_concepts,
+        "guide_refs": guide_refs,
+        "chunks": chunks[:EXTRACT_MAX_CHUNKS],
+        "truncated": len(chunks) > EXTRACT_MAX_CHUNKS,
+        "cache_key": content_key(f'extract-concepts-v2-{llm_provider_name()}', raw_text)
+    }
+    
+    cached = extract_cache.get(plan["cache_key"])
+    if cached is not None:
+        return plan, dict(cached, local_concepts=local_concepts, cached=True)
+    
+    if not llm_provider:
+        return plan, extract_fallback(local_concepts, guide_refs)
+    return plan, None
+
+def finish_review(plan, result):
+    if len(plan["chunks"]) > 1:
+        result['chunks'] = len(plan["chunks"])
+        if plan["truncated"]:
+            result['truncated'] = True
+    
+    all_concept_names = [c['name'] for c in result.get('concepts', [])]
+    all_concept_names.extend(plan["local_concepts"])
+    
+    result['guide_references'] = find_guide_references(all_concept_names)
+    if not result.get('partial'):
+        extract_cache.put(plan["cache_key"], dict(result))
+    result['local_concepts'] = plan["local_concepts"]
+    return result
+
+def analyze_review(raw_text, local_concepts=None, timeout=None, fanout=False):
+    # fanout=True (batch items) takes a shared fan-out slot for single-chunk
+    # reviews too; chunked reviews always do.
+    plan, response = plan_review(raw_text, local_concepts)
+    if response is not None:
+        return response
+    
+    try:
+        if len(plan["chunks"]) > 1:
+            result = request_extract_chunked(llm_provider, plan["chunks"], timeout=timeout)
+        elif fanout:
+            result = fanout_call(lambda: request_extract(llm_provider, raw_text, timeout=timeout), timeout)
+        else:
+            result = request_extract(llm_provider, raw_text, timeout=timeout)
+        return finish_review(plan, result)
         
     except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "fallback": True,
-            "local_concepts": local_concepts,
-            "guide_references": guide_refs,
-            "concepts": [],
-            "summary": "AI analysis failed - using keyword extraction mode."
-        }), 200
+        return extract_fallback(plan["local_concepts"], plan["guide_refs"], str(e), failure_reason(e))
 
-@app.route('/api/generate-cprs', methods=['POST'])
-def generate_cprs():
+@app.route('/api/extract-concepts', methods=['POST'])
+def extract_concepts():
     data = request.get_json()
-    if not data or 'concept' not in data:
-        return jsonify({"error": "No concept provided"}), 400
-    
-    concept = data['concept'].strip()
-    if not concept:
-        return jsonify({"error": "Concept cannot be empty"}), 400
+    if not data or 'text' not in data:
+        return jsonify({"error": "No text provided"}), 400
     
-    guide_refs = find_guide_references([concept])
+    return jsonify(analyze_review(data['text'])), 200
+
+def merge_extractions(results):
+    local_concepts = {}
+    for result in results:
+        for name in result.get('local_concepts', []):
+            local_concepts.setdefault(name, None)
+    merged_concepts = merge_concepts(results)
+    names = [c['name'] for c in merged_concepts] + list(local_concepts)
+    seen_guides = set()
+    guide_refs = []
+    for ref in find_guide_references(names):
+        if ref['guide'] not in seen_guides:
+            seen_guides.add(ref['guide'])
+            guide_refs.append(ref)
+    return {
+        "concepts": merged_concepts,
+        "local_concepts": list(local_concepts),
+        "guide_references": guide_refs
+    }
+
+@app.route('/api/extract-concepts/batch', methods=['POST'])
+def extract_concepts_batch():
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object with a texts list"}), 400
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "texts must be a non-empty list"}), 400
+    if len(texts) > EXTRACT_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {EXTRACT_BATCH_MAX_ITEMS} texts per batch"}), 400
+    if not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "texts must contain only strings"}), 400
     
-    if not openai_client:
-        return jsonify({
-            "fallback": True,
-            "fallback_reason": "OpenAI API key not configured",
-            "concept": concept,
-            "guide_references": guide_refs,
-            "questions": []
-        }), 200
+    try:
+        concurrency = int(data.get('concurrency', EXTRACT_BATCH_CONCURRENCY))
+        item_timeout = float(data.get('timeout', EXTRACT_BATCH_ITEM_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency and timeout must be numbers"}), 400
+    concurrency = max(1, min(concurrency, EXTRACT_BATCH_CONCURRENCY))
+    item_timeout = max(1.0, min(item_timeout, EXTRACT_BATCH_ITEM_TIMEOUT))
     
+    local = [extract_concepts_from_text(text) for text in texts]
+    results = [None] * len(texts)
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(texts)))
     try:
-        prompt = f"""You are an Azure certification expert using the CPRS (Concept-Pathway Reinforcement System) methodology.
+        futures = [
+            executor.submit(analyze_review, text, local_concepts, item_timeout, True)
+            for text, local_concepts in zip(texts, local)
+        ]
+        # The client-side timeout bounds each call; this guard covers time
+        # spent queued behind the concurrency limit as well.
+        queue_rounds = -(-len(texts) // concurrency)
+        deadline = time.monotonic() + item_timeout * queue_rounds + 1
+        for index, future in enumerate(futures):
+            try:
+                results[index] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                results[index] = extract_fallback(local[index], find_guide_references(local[index]), "Timed out", 'timeout')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return jsonify({
+        "items": results,
+        "merged": merge_extractions(results)
+    })
+
+def build_cprs_prompt(concept):
+    return f"""You are an Azure certification expert using the CPRS (Concept-Pathway Reinforcement System) methodology.
 
 Generate 6 SEPARATE multiple-choice questions (MCQ) for: "{concept}"
 
@@ -333,59 +901,391 @@ Format your response as JSON with ALL 6 questions as MCQs:
     "objective": "X.X (the AZ-104 exam objective code)"
 }}"""
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an Azure certification expert. Generate accurate, exam-ready content following the CPRS methodology. All Azure facts must be authoritative and current."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=3000
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        result['guide_references'] = guide_refs
-        
-        return jsonify(result)
-        
-    except Exception as e:
-        return jsonify({
-            "error": str(e),
+CPRS_SYSTEM_PROMPT = "You are an Azure certification expert. Generate accurate, exam-ready content following the CPRS methodology. All Azure facts must be authoritative and current."
+
+def cprs_messages(concept):
+    return [
+        {"role": "system", "content": CPRS_SYSTEM_PROMPT},
+        {"role": "user", "content": build_cprs_prompt(concept)}
+    ]
+
+def request_cprs(provider, concept):
+    messages = cprs_messages(concept)
+    key = content_key(f'generate-cprs-{provider.name}', messages[1]["content"])
+    return json.loads(llm_flight.do(key, lambda: llm_complete(provider, 'generate-cprs', messages, 3000)))
+
+class CprsQuestionStream:
+    # Incremental scanner over the streamed CPRS JSON. It tracks string and
+    # nesting state as chunks arrive and hands back each element of the
+    # top-level "questions" array as soon as its closing brace is seen.
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_key = None
+        self.questions_depth = None
+        self.object_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = text[self.string_start + 1:self.pos]
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif ch in '{[':
+                if ch == '[' and self.depth == 1 and self.last_key == 'questions':
+                    self.questions_depth = self.depth + 1
+                elif ch == '{' and self.questions_depth is not None and self.depth == self.questions_depth:
+                    self.object_start = self.pos
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if ch == ']' and self.questions_depth is not None and self.depth == self.questions_depth - 1:
+                    self.questions_depth = None
+                elif ch == '}' and self.object_start is not None and self.depth == self.questions_depth:
+                    try:
+                        completed.append(json.loads(text[self.object_start:self.pos + 1]))
+                    except ValueError:
+                        pass
+                    self.object_start = None
+            self.pos += 1
+        return completed
+
+    def result(self):
+        return json.loads(self.text)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def plan_cprs(data, endpoint='generate-cprs'):
+    # Validation and question-bank lookup for generate-cprs, shared with the
+    # streaming route and the async handler in asgi.py. Returns
+    # (concept, guide_refs, response); response is a (payload, status) pair
+    # when no model call is needed.
+    if not isinstance(data, dict) or 'concept' not in data:
+        return None, None, ({"error": "No concept provided"}, 400)
+    if not isinstance(data['concept'], str):
+        return None, None, ({"error": "concept must be a string"}, 400)
+    
+    concept = data['concept'].strip()
+    if not concept:
+        return None, None, ({"error": "Concept cannot be empty"}, 400)
+    
+    mode = data.get('mode', 'auto')
+    if mode not in ('auto', 'bank', 'live'):
+        return None, None, ({"error": "mode must be one of auto, bank, live"}, 400)
+    objective = data.get('objective')
+    if objective is not None and not isinstance(objective, str):
+        return None, None, ({"error": "objective must be a string such as \"1.2\""}, 400)
+    
+    guide_refs = find_guide_references([concept])
+    
+    if mode != 'live':
+        stored = cprs_bank.get(concept, objective, llm_provider_name())
+        if stored is not None:
+            stored['guide_references'] = guide_refs
+            stored['source'] = 'bank'
+            return concept, guide_refs, (stored, 200)
+        if mode == 'bank':
+            return concept, guide_refs, ({"error": "No stored question set for this concept", "concept": concept}, 404)
+    
+    if not llm_provider:
+        fallback_responses.inc(endpoint, 'unconfigured')
+        return concept, guide_refs, ({
             "fallback": True,
+            "fallback_reason": "OpenAI API key not configured",
             "concept": concept,
             "guide_references": guide_refs,
             "questions": []
-        }), 200
+        }, 200)
+    return concept, guide_refs, None
+
+def finish_cprs(concept, guide_refs, result):
+    if result.get('questions'):
+        cprs_bank.put(concept, result, provider=llm_provider_name())
+    result['guide_references'] = guide_refs
+    result['source'] = 'live'
+    return result
+
+def cprs_failure(concept, guide_refs, error):
+    fallback_responses.inc('generate-cprs', failure_reason(error))
+    return {
+        "error": str(error),
+        "fallback": True,
+        "concept": concept,
+        "guide_references": guide_refs,
+        "questions": []
+    }
+
+@app.route('/api/generate-cprs', methods=['POST'])
+def generate_cprs():
+    concept, guide_refs, response = plan_cprs(request.get_json())
+    if response is not None:
+        payload, status = response
+        return jsonify(payload), status
+    
+    try:
+        return jsonify(finish_cprs(concept, guide_refs, request_cprs(llm_provider, concept)))
+    except Exception as e:
+        return jsonify(cprs_failure(concept, guide_refs, e)), 200
+
+@app.route('/api/generate-cprs/stream', methods=['POST'])
+def generate_cprs_stream():
+    concept, guide_refs, response = plan_cprs(request.get_json(), 'generate-cprs-stream')
+    if response is not None and response[1] != 200:
+        payload, status = response
+        return jsonify(payload), status
+    
+    def events():
+        if response is not None:
+            stored = response[0]
+            if stored.get('fallback'):
+                yield sse_event('error', stored)
+                return
+            for index, question in enumerate(stored.get('questions', [])):
+                yield sse_event('question', dict(question, index=index))
+            yield sse_event('done', {
+                "concept": stored.get('concept', concept),
+                "objective": stored.get('objective', ''),
+                "guide_references": guide_refs,
+                "source": "bank"
+            })
+            return
+        
+        parser = CprsQuestionStream()
+        emitted = 0
+        usage = {}
+        start = time.perf_counter()
+        streamed = False
+        try:
+            for delta in llm_provider.stream(cprs_messages(concept), max_tokens=3000, usage=usage):
+                for question in parser.feed(delta):
+                    yield sse_event('question', dict(question, index=emitted))
+                    emitted += 1
+            streamed = True
+            record_llm_call('generate-cprs-stream', 'ok', time.perf_counter() - start, usage)
+            result = parser.result()
+        except Exception as e:
+            if not streamed:
+                record_llm_call('generate-cprs-stream', failure_reason(e), time.perf_counter() - start, usage)
+            fallback_responses.inc('generate-cprs-stream', failure_reason(e))
+            yield sse_event('error', {
+                "error": str(e),
+                "fallback": True,
+                "concept": concept,
+                "guide_references": guide_refs,
+                "questions": []
+            })
+            return
+        
+        if result.get('questions'):
+            cprs_bank.put(concept, result, provider=llm_provider_name())
+        yield sse_event('done', {
+            "concept": result.get('concept', concept),
+            "objective": result.get('objective', ''),
+            "guide_references": guide_refs,
+            "source": "live"
+        })
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/admin/cache', methods=['GET'])
+def get_cache_stats():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    return jsonify({
+        "extract-concepts": extract_cache.stats(),
+        "single-flight": llm_flight.stats(),
+        "single-flight-async": llm_async_flight.stats()
+    })
+
+@app.route('/api/admin/cache', methods=['DELETE'])
+def purge_cache():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    return jsonify({"purged": {"extract-concepts": extract_cache.purge()}})
+
+@app.route('/api/admin/llm', methods=['GET'])
+def get_llm_stats():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    if not llm_provider:
+        return jsonify({"provider": None})
+    return jsonify(dict(llm_provider.stats(), provider=llm_provider.name))
+
+@app.route('/api/admin/sync', methods=['GET'])
+def get_sync_stats():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    stats = {}
+    for layer in sync_store_layers(sync_store):
+        if hasattr(layer, 'stats'):
+            stats[layer.stats_key] = layer.stats()
+        if getattr(layer, 'store', None) is None:
+            stats["backend"] = type(layer).__name__
+    return jsonify(stats)
+
+@app.route('/api/admin/sync/export', methods=['GET'])
+def export_sync():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    chunks = export_ndjson(sync_store)
+    response = Response(stream_with_context(chunks), mimetype='application/x-ndjson')
+    if negotiate_encoding(request.headers.get('Accept-Encoding'), offered=("gzip",)):
+        response.response = stream_with_context(gzip_stream(chunks))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Disposition'] = 'attachment; filename="sync-export.ndjson"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/admin/sync/import', methods=['POST'])
+def import_sync():
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    encoding = (request.headers.get('Content-Encoding') or 'identity').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        lines = gzip.GzipFile(fileobj=request.stream)
+    elif encoding == 'identity':
+        lines = request.stream
+    else:
+        return jsonify({"error": f"Unsupported Content-Encoding {encoding!r}"}), 415
+    try:
+        summary = import_ndjson(sync_store, lines)
+    except (OSError, EOFError) as e:
+        return jsonify({"error": f"Invalid request body: {e}"}), 400
+    return jsonify(summary)
 
 @app.route('/api/user', methods=['POST'])
 def create_user():
     user_id = f"user_{uuid.uuid4()}"
     return jsonify({"userId": user_id})
 
+def sync_etag(version):
+    return f'"{version}"'
+
+def parse_if_match(header):
+    # Returns the expected version, None when the header is absent, or
+    # ANY_VERSION for "*", which matches only an existing document.
+    if not header:
+        return None
+    if header.strip() == '*':
+        return ANY_VERSION
+    value = header.split(',')[0].strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise ValueError("If-Match must be a version ETag")
+    return int(value)
+
+def etag_matches(header, version):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    current = sync_etag(version)
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == current:
+            return True
+    return False
+
+def sync_request_json():
+    # Returns (payload, error_response). Clients may gzip (or zstd) large
+    # sync documents and say so with Content-Encoding.
+    encoding = request.headers.get('Content-Encoding')
+    if not encoding or encoding.strip().lower() == 'identity':
+        return request.get_json(), None
+    try:
+        body = decompress_body(request.get_data(), encoding, SYNC_MAX_BODY_BYTES)
+    except UnsupportedEncoding as e:
+        return None, (jsonify({"error": str(e)}), 415)
+    except CompressionError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    try:
+        return json.loads(body), None
+    except ValueError:
+        return None, (jsonify({"error": "Request body is not valid JSON"}), 400)
+
+def encode_sync_response(response):
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    body = response.get_data()
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        response.set_data(compress_body(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def version_conflict_response(e):
+    response = jsonify({"error": "Version conflict", "version": e.current_version})
+    response.status_code = 412
+    response.headers['ETag'] = sync_etag(e.current_version)
+    return response
+
+def store_unavailable_response(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after or 1)))
+    return response
+
 @app.route('/api/sync', methods=['GET'])
 def get_sync():
     user_id = request.args.get('userId')
     if not user_id:
         return jsonify({"error": "userId required"}), 400
-    
-    file_path = os.path.join(SYNC_DATA_DIR, f"{user_id}.json")
-    if not os.path.exists(file_path):
-        return jsonify({"found": False})
+    if not valid_user_id(user_id):
+        return jsonify({"error": "Invalid userId"}), 400
     
     try:
-        with open(file_path, 'r') as f:
-            sync_data = json.load(f)
-        return jsonify({
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            version = sync_store.version(user_id)
+            if version is not None and etag_matches(if_none_match, version):
+                response = Response(status=304)
+                response.headers['ETag'] = sync_etag(version)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+        
+        record = sync_store.get(user_id)
+        if record is None:
+            return jsonify({"found": False})
+        response = jsonify({
             "found": True,
-            "data": sync_data.get("data", {}),
-            "updatedAt": sync_data.get("updatedAt", "")
+            "data": record["data"],
+            "updatedAt": record["updatedAt"],
+            "version": record["version"]
         })
+        response.headers['ETag'] = sync_etag(record["version"])
+        response.headers['Cache-Control'] = 'no-cache'
+        return encode_sync_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/sync', methods=['PUT'])
 def put_sync():
-    data = request.get_json()
+    data, error = sync_request_json()
+    if error:
+        return error
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
@@ -394,29 +1294,130 @@ def put_sync():
     
     if not user_id or not sync_data:
         return jsonify({"error": "userId and data required"}), 400
+    if not valid_user_id(user_id):
+        return jsonify({"error": "Invalid userId"}), 400
+    try:
+        expected_version = parse_if_match(request.headers.get('If-Match'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        record = sync_store.put(user_id, sync_data, expected_version)
+    except VersionConflict as e:
+        return version_conflict_response(e)
+    except StoreUnavailable as e:
+        return store_unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    response = jsonify({"success": True, "updatedAt": record["updatedAt"], "version": record["version"]})
+    response.headers['ETag'] = sync_etag(record["version"])
+    return response
+
+@app.route('/api/sync', methods=['PATCH'])
+def patch_sync():
+    data, error = sync_request_json()
+    if error:
+        return error
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    user_id = data.get('userId')
+    if not user_id or not valid_user_id(user_id):
+        return jsonify({"error": "Valid userId required"}), 400
+    if ('patch' in data) == ('ops' in data):
+        return jsonify({"error": "Provide exactly one of patch (JSON Merge Patch) or ops (list of operations)"}), 400
+    if 'ops' in data and not isinstance(data['ops'], list):
+        return jsonify({"error": "ops must be a list"}), 400
+    if 'patch' in data and not isinstance(data['patch'], dict):
+        # A non-object merge patch replaces the whole document.
+        return jsonify({"error": "patch must be a JSON object"}), 422
+    if not request.headers.get('If-Match'):
+        return jsonify({"error": "If-Match header with the current version is required"}), 428
+    try:
+        expected_version = parse_if_match(request.headers.get('If-Match'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    file_path = os.path.join(SYNC_DATA_DIR, f"{user_id}.json")
+    if 'patch' in data:
+        mutate = lambda current: apply_merge_patch(current, data['patch'])
+    else:
+        mutate = lambda current: apply_ops(current, data['ops'])
     
     try:
-        from datetime import datetime
-        now = datetime.utcnow().isoformat() + "Z"
-        with open(file_path, 'w') as f:
-            json.dump({"data": sync_data, "updatedAt": now}, f)
-        return jsonify({"success": True, "updatedAt": now})
+        record = sync_store.update(user_id, mutate, expected_version)
+    except VersionConflict as e:
+        return version_conflict_response(e)
+    except PatchError as e:
+        return jsonify({"error": str(e)}), 422
+    except StoreUnavailable as e:
+        return store_unavailable_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    response = jsonify({"success": True, "updatedAt": record["updatedAt"], "version": record["version"]})
+    response.headers['ETag'] = sync_etag(record["version"])
+    return response
+
+@app.route('/api/sync/merge', methods=['POST'])
+def merge_sync():
+    # Devices push only what changed locally and get the merged document back
+    # in the same round-trip. The merge is order-independent, so no If-Match
+    # is needed and a retried push is harmless.
+    data, error = sync_request_json()
+    if error:
+        return error
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    user_id = data.get('userId')
+    incoming = data.get('data')
+    if not user_id or not valid_user_id(user_id):
+        return jsonify({"error": "Valid userId required"}), 400
+    if not isinstance(incoming, dict):
+        return jsonify({"error": "data must be an object"}), 400
+    
+    try:
+        record = sync_store.update(user_id, lambda current: merge_sync_documents(current, incoming, SYNC_HISTORY_MAX))
+    except StoreUnavailable as e:
+        return store_unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    response = jsonify({
+        "success": True,
+        "data": record["data"],
+        "updatedAt": record["updatedAt"],
+        "version": record["version"]
+    })
+    response.headers['ETag'] = sync_etag(record["version"])
+    return encode_sync_response(response)
+
+def send_static(path):
+    # Fingerprinted assets from `python static_assets.py build` are immutable
+    # for a year; HTML and unhashed files are revalidated by ETag, so a
+    # repeat visit costs a 304 per page.
+    # Text files also have .br/.gz siblings written at build time, picked by
+    # Accept-Encoding so compression costs nothing per request.
+    etag, cache_control = static_site.cache_policy(path)
+    variant = static_site.variant(path, request.headers.get('Accept-Encoding'))
+    if variant:
+        file_path, encoding, mimetype = variant
+        response = send_from_directory(static_site.root, file_path, mimetype=mimetype,
+                                       etag=f"{etag}-{encoding}" if etag else True)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(static_site.root, path, etag=etag or True)
+    if static_site.has_variants(path):
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 @app.route('/')
 def serve_index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_static('index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    response = send_from_directory(app.static_folder, path)
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_static(path)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # Development server only; production runs under gunicorn (gunicorn.conf.py).
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '5000')), debug=False)
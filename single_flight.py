@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    # Concurrent callers asking for the same key share one execution: the
+    # first caller runs the function, the rest block until it finishes and
+    # receive the same result (or exception).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {"executions": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.counters["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.counters["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["in_flight"] = len(self._calls)
+        return counters
+
+
+class AsyncSingleFlight:
+    # SingleFlight for coroutines on one event loop. The shared call runs as
+    # its own task, so a caller that goes away (client disconnect) stops
+    # waiting without cancelling the call for everyone else.
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.counters["executions"] += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["errors"] += 1
+
+    def stats(self):
+        counters = dict(self.counters)
+        counters["in_flight"] = len(self._calls)
+        return counters
@@ -0,0 +1,282 @@
+import os
+import re
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import argparse
+import posixpath
+import mimetypes
+from urllib.parse import unquote
+from content_codecs import brotli, brotli_available, negotiate_encoding
+
+
+MANIFEST_NAME = 'asset-manifest.json'
+HTML_EXTENSIONS = ('.html', '.htm')
+SKIP_EXTENSIONS = ('.md', '.bak', '.gz', '.br')
+HASH_LENGTH = 10
+
+# Text formats worth precompressing; images and archives are already compressed.
+PRECOMPRESS_EXTENSIONS = ('.html', '.htm', '.js', '.css', '.csv', '.json', '.svg', '.txt', '.xml')
+MIN_PRECOMPRESS_BYTES = 1024
+# Preference order when a client accepts both.
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+REFERENCE_PATTERN = re.compile(r'''(\b(?:src|href)\s*=\s*)(["'])([^"'<>]+?)\2''', re.IGNORECASE)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hashed_name(rel_path, digest):
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def walk_files(source_dir):
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name.endswith(SKIP_EXTENSIONS):
+                continue
+            full = os.path.join(root, name)
+            yield os.path.relpath(full, source_dir).replace(os.sep, '/'), full
+
+
+def rewrite_references(html, page_path, assets):
+    # Points relative src/href attributes at the fingerprinted copy of the
+    # asset. Absolute URLs, in-page anchors and template placeholders are
+    # left alone.
+    page_dir = posixpath.dirname(page_path)
+
+    def replace(match):
+        prefix, quote, url = match.groups()
+        if re.match(r'^(?:[a-z][a-z0-9+.-]*:|//|#|\$\{)', url, re.IGNORECASE) or url.startswith('/'):
+            return match.group(0)
+        target, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        resolved = posixpath.normpath(posixpath.join(page_dir, unquote(target)))
+        if resolved not in assets:
+            return match.group(0)
+        hashed = posixpath.relpath(assets[resolved], page_dir or '.')
+        return f"{prefix}{quote}{hashed}{suffix}{quote}"
+
+    return REFERENCE_PATTERN.sub(replace, html)
+
+
+def available_encodings():
+    return tuple((encoding, suffix) for encoding, suffix in ENCODING_SUFFIXES
+                 if encoding != 'br' or brotli_available())
+
+
+def compress_file(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory, reuse_dir=None, unchanged=()):
+    # Writes .br/.gz siblings for text files whose sibling is missing or
+    # older than the file. Siblings of files listed in `unchanged` are copied
+    # from reuse_dir (the previous build) instead of being recompressed.
+    # Returns {path: {"identity": bytes, encoding: bytes, ...}}.
+    sizes = {}
+    compressed = reused = 0
+    for rel_path, full in walk_files(directory):
+        if not rel_path.lower().endswith(PRECOMPRESS_EXTENSIONS) or rel_path == MANIFEST_NAME:
+            continue
+        size = os.path.getsize(full)
+        if size < MIN_PRECOMPRESS_BYTES:
+            continue
+        entry = {"identity": size}
+        data = None
+        for encoding, suffix in available_encodings():
+            sibling = full + suffix
+            previous = os.path.join(reuse_dir, rel_path) + suffix if reuse_dir else None
+            if os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(full):
+                pass
+            elif previous and rel_path in unchanged and os.path.exists(previous):
+                shutil.copy2(previous, sibling)
+                reused += 1
+            else:
+                if data is None:
+                    with open(full, 'rb') as f:
+                        data = f.read()
+                body = compress_file(data, encoding)
+                if len(body) >= size:
+                    continue
+                with open(sibling, 'wb') as f:
+                    f.write(body)
+                compressed += 1
+            entry[encoding] = os.path.getsize(sibling)
+        if len(entry) > 1:
+            sizes[rel_path] = entry
+    return sizes, {"compressed": compressed, "reused": reused}
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build(source_dir, out_dir):
+    # Copies source_dir to out_dir, adds a content-hashed copy of every
+    # non-HTML asset and rewrites the HTML to reference the hashed names.
+    # HTML keeps its URL so links and bookmarks still work. The new tree is
+    # built beside the old one and swapped in at the end.
+    final_dir, out_dir = out_dir, out_dir.rstrip('/\\') + '.new'
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    files = list(walk_files(source_dir))
+    assets, etags = {}, {}
+    for rel_path, full in files:
+        if rel_path.lower().endswith(HTML_EXTENSIONS):
+            continue
+        digest = file_digest(full)
+        assets[rel_path] = hashed_name(rel_path, digest)
+        etags[rel_path] = etags[assets[rel_path]] = digest[:32]
+
+    rewritten = 0
+    for rel_path, full in files:
+        target = os.path.join(out_dir, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if rel_path.lower().endswith(HTML_EXTENSIONS):
+            with open(full, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                original = f.read()
+            html = rewrite_references(original, rel_path, assets)
+            rewritten += html != original
+            data = html.encode('utf-8', errors='surrogateescape')
+            with open(target, 'wb') as f:
+                f.write(data)
+            etags[rel_path] = hashlib.sha256(data).hexdigest()[:32]
+        else:
+            shutil.copy2(full, target)
+            shutil.copy2(full, os.path.join(out_dir, assets[rel_path]))
+
+    previous = load_manifest(final_dir) or {}
+    unchanged = {path for path, etag in etags.items() if previous.get("etags", {}).get(path) == etag}
+    sizes, counts = precompress(out_dir, reuse_dir=final_dir, unchanged=unchanged)
+
+    manifest = {"assets": assets, "etags": etags, "encodings": sizes}
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if os.path.isdir(final_dir):
+        old_dir = final_dir.rstrip('/\\') + '.old'
+        if os.path.isdir(old_dir):
+            shutil.rmtree(old_dir)
+        os.rename(final_dir, old_dir)
+        os.rename(out_dir, final_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.rename(out_dir, final_dir)
+    return dict({"files": len(files), "assets": len(assets), "pages_rewritten": rewritten}, **counts)
+
+
+class StaticSite:
+    # Serving policy for docs/. With a build present, fingerprinted assets
+    # are cached for a year as immutable and everything else (HTML entry
+    # points, unhashed asset URLs) is revalidated against a strong content
+    # ETag. Without a build, files are served straight from the source
+    # directory and revalidated with Werkzeug's file ETag.
+    def __init__(self, source_dir, build_dir):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.reload()
+
+    def reload(self):
+        manifest_path = os.path.join(self.build_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        self.built = manifest is not None
+        self.root = self.build_dir if self.built else self.source_dir
+        self.immutable = set(manifest["assets"].values()) if manifest else set()
+        self.etags = manifest["etags"] if manifest else {}
+        self.encodings = manifest.get("encodings", {}) if manifest else {}
+
+    def cache_policy(self, path):
+        # Returns (etag, Cache-Control) for a request path relative to root.
+        path = path.lstrip('/')
+        cache_control = IMMUTABLE_CACHE if path in self.immutable else REVALIDATE_CACHE
+        return self.etags.get(path), cache_control
+
+    def variant(self, path, accept_encoding):
+        # Picks a precompressed sibling the client accepts. Returns
+        # (file path, content coding, mimetype of the original), or None to
+        # serve the file itself.
+        path = path.lstrip('/')
+        offered = self.encodings.get(path)
+        if not offered:
+            return None
+        encoding = negotiate_encoding(accept_encoding, offered=[e for e, _ in ENCODING_SUFFIXES if e in offered])
+        if encoding is None:
+            return None
+        suffix = dict(ENCODING_SUFFIXES)[encoding]
+        return path + suffix, encoding, mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def has_variants(self, path):
+        return bool(self.encodings.get(path.lstrip('/')))
+
+
+def size_report(sizes):
+    # One row per file, largest savings first, plus a total row.
+    rows = []
+    totals = {"identity": 0, "gzip": 0, "br": 0}
+    for path, entry in sizes.items():
+        best = min(size for key, size in entry.items() if key != "identity")
+        rows.append((entry["identity"] - best, path, entry))
+        totals["identity"] += entry["identity"]
+        for encoding in ("gzip", "br"):
+            totals[encoding] += entry.get(encoding, entry["identity"])
+    lines = [f"{'file':60} {'bytes':>10} {'gzip':>10} {'br':>10} {'saved':>10} {'ratio':>7}"]
+    for saved, path, entry in sorted(rows, reverse=True):
+        lines.append(f"{path[:60]:60} {entry['identity']:>10} {entry.get('gzip', '-'):>10} {entry.get('br', '-'):>10} "
+                     f"{saved:>10} {entry['identity'] / (entry['identity'] - saved):>6.1f}x")
+    if rows:
+        best_total = min(totals["gzip"], totals["br"])
+        lines.append(f"{'TOTAL':60} {totals['identity']:>10} {totals['gzip']:>10} {totals['br']:>10} "
+                     f"{totals['identity'] - best_total:>10} {totals['identity'] / best_total:>6.1f}x")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    root = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets for docs/.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Hash assets and rewrite HTML references")
+    build_cmd.add_argument("--source", default=os.path.join(root, 'docs'))
+    build_cmd.add_argument("--out", default=os.environ.get("STATIC_BUILD_DIR", os.path.join(root, '.static_build')))
+    report_cmd = sub.add_parser("report", help="Show bytes saved by the precompressed variants per file")
+    report_cmd.add_argument("--dir", default=os.environ.get("STATIC_BUILD_DIR", os.path.join(root, '.static_build')))
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        manifest = load_manifest(args.dir)
+        if manifest is None:
+            print(f"No build found in {args.dir}; run 'python static_assets.py build' first", file=sys.stderr)
+            return 1
+        print(size_report(manifest.get("encodings", {})))
+        return 0
+
+    summary = build(args.source, args.out)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
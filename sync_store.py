@@ -0,0 +1,1097 @@
+import os
+import re
+import sys
+import json
+import gzip
+import zlib
+import sqlite3
+import atexit
+import logging
+import argparse
+import time
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+from datetime import datetime
+from content_codecs import encode_payload, decode_payload, payload_codec
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_scores (
+  user_id TEXT PRIMARY KEY,
+  data TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  version INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_scores_updated ON user_scores(updated_at);
+"""
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version):
+        super().__init__(f"Version conflict: current version is {current_version}")
+        self.current_version = current_version
+
+
+class PatchError(ValueError):
+    pass
+
+
+# expected_version for "If-Match: *": any version, but only if the user has a
+# document. Stores see version 0 for a user with none.
+ANY_VERSION = "*"
+
+
+def version_matches(expected_version, current_version):
+    if expected_version is None:
+        return True
+    if expected_version == ANY_VERSION:
+        return current_version > 0
+    return expected_version == current_version
+
+
+class StoreUnavailable(Exception):
+    # The write was refused and nothing changed; the client may retry later.
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def apply_merge_patch(target, patch):
+    # RFC 7386 JSON Merge Patch: objects merge recursively, null deletes.
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _pointer_parts(path):
+    if path == '':
+        return []
+    if not path.startswith('/'):
+        raise PatchError(f"Invalid path {path!r}")
+    return [p.replace('~1', '/').replace('~0', '~') for p in path[1:].split('/')]
+
+
+def _container(document, parts, path):
+    node = document
+    for part in parts[:-1]:
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+        elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            raise PatchError(f"Path not found: {path}")
+    return node
+
+
+def apply_ops(document, ops):
+    # Subset of RFC 6902 JSON Patch: add, replace and remove on JSON Pointer
+    # paths, which is what field-level score updates need.
+    document = json.loads(json.dumps(document))
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in ('add', 'replace', 'remove') or 'path' not in op:
+            raise PatchError(f"Unsupported operation {op!r}")
+        parts = _pointer_parts(op['path'])
+        if not parts:
+            raise PatchError("Operations on the document root are not supported")
+        node = _container(document, parts, op['path'])
+        key = parts[-1]
+        if isinstance(node, dict):
+            if op['op'] == 'remove':
+                if key not in node:
+                    raise PatchError(f"Path not found: {op['path']}")
+                del node[key]
+            else:
+                if op['op'] == 'replace' and key not in node:
+                    raise PatchError(f"Path not found: {op['path']}")
+                node[key] = op.get('value')
+        elif isinstance(node, list):
+            if key == '-' and op['op'] == 'add':
+                node.append(op.get('value'))
+                continue
+            if not key.isdigit() or int(key) > len(node) or (op['op'] != 'add' and int(key) == len(node)):
+                raise PatchError(f"Path not found: {op['path']}")
+            index = int(key)
+            if op['op'] == 'add':
+                node.insert(index, op.get('value'))
+            elif op['op'] == 'replace':
+                node[index] = op.get('value')
+            else:
+                del node[index]
+        else:
+            raise PatchError(f"Path not found: {op['path']}")
+    return document
+
+
+def _score_rank(document, domain):
+    score = (document.get("mergedQuizScores") or {}).get(domain)
+    if not isinstance(score, dict):
+        return None
+    return (_last_updated(document, domain), score.get("total") or 0, score.get("correct") or 0,
+            json.dumps(score, sort_keys=True))
+
+
+def _last_updated(document, domain):
+    meta = (document.get("domainScoreMetadata") or {}).get(domain)
+    return str(meta.get("lastUpdated") or '') if isinstance(meta, dict) else ''
+
+
+def _snapshot_key(snapshot):
+    taken_at = ''
+    if isinstance(snapshot, dict):
+        taken_at = snapshot.get("takenAt") or snapshot.get("t") or ''
+    return (str(taken_at), json.dumps(snapshot, sort_keys=True))
+
+
+MERGED_KEYS = ("mergedQuizScores", "domainScoreMetadata", "mergedQuizHistory")
+
+
+def merge_sync_documents(current, incoming, history_max=30):
+    # Merges a device's push into the stored document. For the score keys the
+    # result is the same whichever side is "current", and merging the same
+    # push twice changes nothing:
+    # - per domain, the score whose domainScoreMetadata lastUpdated is newest
+    #   wins (ties go to the larger total, then correct) and brings its
+    #   metadata along;
+    # - mergedQuizHistory is the union of both sides' snapshots ordered by
+    #   takenAt, keeping the newest history_max.
+    # Any other top-level key is taken from `incoming` when present.
+    current = current if isinstance(current, dict) else {}
+    incoming = incoming if isinstance(incoming, dict) else {}
+    merged = dict(current)
+    merged.update((k, v) for k, v in incoming.items() if k not in MERGED_KEYS)
+    sides = (current, incoming)
+
+    scores, metadata = {}, {}
+    domains = set()
+    for doc in sides:
+        domains.update(doc.get("mergedQuizScores") or {})
+        domains.update(doc.get("domainScoreMetadata") or {})
+    for domain in sorted(domains):
+        ranked = [(rank, doc) for doc in sides if (rank := _score_rank(doc, domain)) is not None]
+        if ranked:
+            winner = max(ranked, key=lambda item: item[0])[1]
+            scores[domain] = winner["mergedQuizScores"][domain]
+        else:
+            winner = max(sides, key=lambda doc: _last_updated(doc, domain))
+        meta = (winner.get("domainScoreMetadata") or {}).get(domain)
+        if meta is not None:
+            metadata[domain] = meta
+
+    history = {}
+    for doc in sides:
+        snapshots = doc.get("mergedQuizHistory")
+        if isinstance(snapshots, list):
+            for snapshot in snapshots:
+                history[_snapshot_key(snapshot)] = snapshot
+
+    if any("mergedQuizScores" in doc for doc in sides):
+        merged["mergedQuizScores"] = scores
+    if any("domainScoreMetadata" in doc for doc in sides):
+        merged["domainScoreMetadata"] = metadata
+    if any("mergedQuizHistory" in doc for doc in sides):
+        ordered = [history[key] for key in sorted(history)]
+        merged["mergedQuizHistory"] = ordered[-history_max:] if history_max else ordered
+    return merged
+
+
+def valid_user_id(user_id):
+    return bool(user_id and USER_ID_PATTERN.match(user_id))
+
+
+def utc_now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def atomic_write_json(path, payload):
+    # Write to a temp file in the same directory, fsync it, then rename over
+    # the target so readers only ever see the old or the new document.
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class LockStats:
+    # Counts lock acquisitions and how many had to wait for another writer.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"acquisitions": 0, "contended": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def record(self, contended, waited=0.0):
+        with self._lock:
+            self.counters["acquisitions"] += 1
+            if contended:
+                self.counters["contended"] += 1
+                self.counters["wait_seconds"] += waited
+                self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["wait_seconds"] = round(counters["wait_seconds"], 6)
+        counters["max_wait_seconds"] = round(counters["max_wait_seconds"], 6)
+        counters["contention_rate"] = round(counters["contended"] / counters["acquisitions"], 4) if counters["acquisitions"] else None
+        return counters
+
+
+class JsonFileSyncStore:
+    stats_key = "locks"
+
+    # Original layout: one <userId>.json file per user under SYNC_DATA_DIR.
+    # Read-modify-write cycles hold an advisory flock on .locks/<userId>.lock,
+    # so workers in different processes serialize per user rather than
+    # globally, and files are replaced by rename so readers never see a
+    # partial document.
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock_dir = os.path.join(directory, '.locks')
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self.lock_stats = LockStats()
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    @contextlib.contextmanager
+    def _user_lock(self, user_id):
+        if fcntl is None:
+            # No flock (Windows): fall back to in-process locks only.
+            with self._thread_locks_guard:
+                lock = self._thread_locks.setdefault(user_id, threading.Lock())
+            contended = not lock.acquire(blocking=False)
+            start = time.monotonic()
+            if contended:
+                lock.acquire()
+            self.lock_stats.record(contended, time.monotonic() - start)
+            try:
+                yield
+            finally:
+                lock.release()
+            return
+        fd = os.open(os.path.join(self.lock_dir, f"{user_id}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            contended = False
+            start = time.monotonic()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                contended = True
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            self.lock_stats.record(contended, time.monotonic() - start)
+            yield
+        finally:
+            os.close(fd)
+
+    def get(self, user_id):
+        try:
+            with open(self._path(user_id), 'r') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        return {"data": record.get("data", {}), "updatedAt": record.get("updatedAt", ""), "version": record.get("version", 1)}
+
+    def version(self, user_id):
+        record = self.get(user_id)
+        return record["version"] if record else None
+
+    def update(self, user_id, mutate, expected_version=None):
+        with self._user_lock(user_id):
+            current = self.get(user_id)
+            current_version = current["version"] if current else 0
+            if not version_matches(expected_version, current_version):
+                raise VersionConflict(current_version)
+            data = mutate(current["data"] if current else {})
+            record = {"data": data, "updatedAt": utc_now(), "version": current_version + 1}
+            atomic_write_json(self._path(user_id), record)
+        return record
+
+    def put(self, user_id, data, expected_version=None):
+        return self.update(user_id, lambda _: data, expected_version)
+
+    def write_records(self, records):
+        for user_id, record in records:
+            with self._user_lock(user_id):
+                atomic_write_json(self._path(user_id), record)
+
+    def import_records(self, records):
+        for user_id, record in records:
+            with self._user_lock(user_id):
+                existing = self.version(user_id) or 0
+                record = dict(record, version=max(existing + 1, record["version"]))
+                atomic_write_json(self._path(user_id), record)
+
+    def stats(self):
+        return self.lock_stats.stats()
+
+    def export_rows(self):
+        for user_id in self.user_ids():
+            record = self.get(user_id)
+            if record is not None:
+                yield user_id, json.dumps(record["data"], separators=(',', ':')).encode('utf-8'), record["updatedAt"], record["version"]
+
+    def user_ids(self):
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json') and not name.startswith('.tmp-'):
+                yield name[:-5]
+
+
+class SqliteSyncStore:
+    stats_key = "locks"
+
+    # Local mirror of the Cloudflare D1 user_scores table. SQLite runs in WAL
+    # mode so readers never block the writer, and each thread keeps its own
+    # connection whose statement cache holds the prepared queries. The data
+    # column holds a codec header byte plus the (usually compressed) JSON;
+    # rows from before compression still hold plain JSON text.
+    def __init__(self, db_path, codec="auto"):
+        self.db_path = db_path
+        self.codec = codec
+        self.lock_stats = LockStats()
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(user_scores)')}
+        if 'version' not in columns:
+            conn.execute('ALTER TABLE user_scores ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=64)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, data):
+        return encode_payload(json.dumps(data, separators=(',', ':')).encode('utf-8'), self.codec)
+
+    def get(self, user_id):
+        row = self._connect().execute(
+            'SELECT data, updated_at, version FROM user_scores WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"data": json.loads(decode_payload(row[0])), "updatedAt": row[1], "version": row[2]}
+
+    def version(self, user_id):
+        # Served from the primary-key index without touching the data column.
+        row = self._connect().execute(
+            'SELECT version FROM user_scores WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _begin_immediate(self, conn):
+        # SQLite has no row locks; writers take the database write lock for
+        # one short transaction. Try without waiting first so contention with
+        # other threads or worker processes can be counted.
+        conn.execute('PRAGMA busy_timeout = 0')
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self.lock_stats.record(False)
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+        finally:
+            conn.execute('PRAGMA busy_timeout = 30000')
+        start = time.monotonic()
+        conn.execute('BEGIN IMMEDIATE')
+        self.lock_stats.record(True, time.monotonic() - start)
+
+    def update(self, user_id, mutate, expected_version=None):
+        # BEGIN IMMEDIATE takes the write lock before reading, so the version
+        # check and the write are one atomic step across threads and processes.
+        conn = self._connect()
+        self._begin_immediate(conn)
+        try:
+            row = conn.execute(
+                'SELECT data, version FROM user_scores WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            current_version = row[1] if row else 0
+            if not version_matches(expected_version, current_version):
+                raise VersionConflict(current_version)
+            data = mutate(json.loads(decode_payload(row[0])) if row else {})
+            now = utc_now()
+            version = current_version + 1
+            conn.execute(
+                'INSERT INTO user_scores (user_id, data, updated_at, version) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, version = excluded.version',
+                (user_id, self._encode(data), now, version)
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return {"data": data, "updatedAt": now, "version": version}
+
+    def put(self, user_id, data, expected_version=None):
+        return self.update(user_id, lambda _: data, expected_version)
+
+    def put_many(self, records):
+        # Only replaces rows older than the incoming copy, so re-running a
+        # migration cannot roll back documents written since.
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO user_scores (user_id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, version = user_scores.version + 1 '
+                'WHERE excluded.updated_at > user_scores.updated_at',
+                ((user_id, self._encode(data), updated_at) for user_id, data, updated_at in records)
+            )
+
+    def write_records(self, records):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO user_scores (user_id, data, updated_at, version) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, version = excluded.version',
+                ((user_id, self._encode(r["data"]), r["updatedAt"], r["version"]) for user_id, r in records)
+            )
+
+    def import_records(self, records):
+        # Restored rows never move a version backwards, so ETags and cached
+        # copies held for the old document cannot match the restored one.
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO user_scores (user_id, data, updated_at, version) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, '
+                'version = MAX(user_scores.version + 1, excluded.version)',
+                ((user_id, self._encode(r["data"]), r["updatedAt"], r["version"]) for user_id, r in records)
+            )
+
+    def export_rows(self):
+        # A dedicated connection reads one consistent WAL snapshot and streams
+        # rows without holding them all in memory. The JSON is handed back
+        # undecoded so the export never parses documents.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            for user_id, blob, updated_at, version in conn.execute(
+                'SELECT user_id, data, updated_at, version FROM user_scores ORDER BY user_id'
+            ):
+                yield user_id, decode_payload(blob), updated_at, version
+        finally:
+            conn.close()
+
+    def recompress(self, batch_size=500):
+        # Rewrites every row with the current codec. Versions and timestamps
+        # are left alone, so clients see no change.
+        conn = self._connect()
+        summary = {"rows": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+        last_id = ''
+        while True:
+            rows = conn.execute(
+                'SELECT user_id, data FROM user_scores WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for user_id, blob in rows:
+                encoded = encode_payload(decode_payload(blob), self.codec)
+                size = len(blob.encode('utf-8')) if isinstance(blob, str) else len(blob)
+                summary["rows"] += 1
+                summary["bytes_before"] += size
+                summary["bytes_after"] += len(encoded)
+                if encoded != blob:
+                    updates.append((encoded, user_id))
+            with conn:
+                conn.executemany('UPDATE user_scores SET data = ? WHERE user_id = ?', updates)
+            summary["rewritten"] += len(updates)
+            last_id = rows[-1][0]
+        return summary
+
+    def stats(self):
+        return self.lock_stats.stats()
+
+    def storage_stats(self):
+        by_codec = {}
+        for (blob,) in self._connect().execute('SELECT data FROM user_scores'):
+            entry = by_codec.setdefault(payload_codec(blob), {"rows": 0, "bytes": 0})
+            entry["rows"] += 1
+            entry["bytes"] += len(blob.encode('utf-8')) if isinstance(blob, str) else len(blob)
+        return by_codec
+
+    def user_ids(self):
+        for (user_id,) in self._connect().execute('SELECT user_id FROM user_scores ORDER BY user_id'):
+            yield user_id
+
+
+class WriteBehindSyncStore:
+    stats_key = "write_behind"
+
+    # Keeps the latest document per user in memory and writes them to the
+    # backing store in one batch per flush window, so a user answering a
+    # question every few seconds costs one write per window instead of one
+    # per answer. Reads see buffered state. Buffering is per process: run a
+    # single worker, or route each user to one worker, when this is enabled.
+    #
+    # An optional observer (see ObservedSyncStore) is told about writes when
+    # they are flushed, as one (document before the window, flushed document)
+    # pair per user, so its own bookkeeping is batched the same way.
+    def __init__(self, store, flush_interval=5.0, max_pending=1000, observer=None):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.observer = observer
+        self._pending = {}
+        # user_id -> document before the first write not yet reported
+        self._observed = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.counters = {"buffered_writes": 0, "flushes": 0, "flushed_records": 0, "forced_flushes": 0, "flush_errors": 0,
+                         "refused_writes": 0}
+        self._thread = threading.Thread(target=self._run, name="sync-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        # A failed flush leaves its batch pending; the next window retries it.
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed; buffered writes stay pending")
+
+    def get(self, user_id):
+        with self._lock:
+            record = self._pending.get(user_id)
+        if record is not None:
+            return dict(record)
+        return self.store.get(user_id)
+
+    def version(self, user_id):
+        with self._lock:
+            record = self._pending.get(user_id)
+        if record is not None:
+            return record["version"]
+        return self.store.version(user_id)
+
+    def _make_room(self):
+        # Called when a write for a user not yet buffered finds the buffer
+        # full. A failed flush refuses the write, so the queue stays bounded
+        # while the backing store is down.
+        with self._lock:
+            self.counters["forced_flushes"] += 1
+        try:
+            self.flush()
+        except Exception as e:
+            with self._lock:
+                self.counters["refused_writes"] += 1
+            raise StoreUnavailable("Sync storage is unavailable; try again shortly",
+                                   retry_after=self.flush_interval) from e
+
+    def update(self, user_id, mutate, expected_version=None):
+        while True:
+            with self._lock:
+                current = self._pending.get(user_id)
+                generation = self._generation
+                full = current is None and len(self._pending) >= self.max_pending
+            if full:
+                self._make_room()
+                continue
+            if current is None:
+                current = self.store.get(user_id)
+            with self._lock:
+                # A flush that finished while the backing store was read may
+                # have dropped a newer buffered version; read again if so.
+                if user_id not in self._pending and generation != self._generation:
+                    continue
+                if user_id not in self._pending and len(self._pending) >= self.max_pending:
+                    continue
+                current = self._pending.get(user_id, current)
+                current_version = current["version"] if current else 0
+                if not version_matches(expected_version, current_version):
+                    raise VersionConflict(current_version)
+                data = mutate(current["data"] if current else {})
+                record = {"data": data, "updatedAt": utc_now(), "version": current_version + 1}
+                if self.observer is not None and user_id not in self._observed:
+                    self._observed[user_id] = current["data"] if current else None
+                self._pending[user_id] = record
+                self.counters["buffered_writes"] += 1
+            return dict(record)
+
+    def put(self, user_id, data, expected_version=None):
+        return self.update(user_id, lambda _: data, expected_version)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+            if not batch:
+                return 0
+            try:
+                self.store.write_records(batch)
+            except Exception:
+                with self._lock:
+                    self.counters["flush_errors"] += 1
+                raise
+            changes = []
+            with self._lock:
+                for user_id, record in batch:
+                    if self._pending.get(user_id) is record:
+                        del self._pending[user_id]
+                        old = self._observed.pop(user_id, None)
+                    else:
+                        # Written again since the batch was taken; the next
+                        # flush reports the rest from this document.
+                        old = self._observed.get(user_id)
+                        self._observed[user_id] = record["data"]
+                    changes.append((old, record["data"]))
+                self._generation += 1
+                self.counters["flushes"] += 1
+                self.counters["flushed_records"] += len(batch)
+            if self.observer is not None:
+                self.observer.record_writes(changes)
+            return len(batch)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def import_records(self, records):
+        self.flush()
+        if self.observer is None:
+            self.store.import_records(records)
+            return
+        old = [self.store.get(user_id) for user_id, _ in records]
+        self.store.import_records(records)
+        self.observer.record_writes(
+            (previous["data"] if previous else None, record["data"])
+            for previous, (_, record) in zip(old, records)
+        )
+
+    def export_rows(self):
+        self.flush()
+        return self.store.export_rows()
+
+    def user_ids(self):
+        with self._lock:
+            pending = set(self._pending)
+        seen = set()
+        for user_id in self.store.user_ids():
+            seen.add(user_id)
+            yield user_id
+        for user_id in sorted(pending - seen):
+            yield user_id
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["pending"] = len(self._pending)
+        counters["max_pending"] = self.max_pending
+        counters["flush_interval"] = self.flush_interval
+        return counters
+
+
+class ObservedSyncStore:
+    # Reports each write's before/after documents to an observer with a
+    # record_writes([(old, new), ...]) method. The old document is the one
+    # the backing store handed to `mutate` inside its atomic update, so the
+    # pair is exact even with concurrent writers.
+    def __init__(self, store, observer):
+        self.store = store
+        self.observer = observer
+
+    def get(self, user_id):
+        return self.store.get(user_id)
+
+    def version(self, user_id):
+        return self.store.version(user_id)
+
+    def update(self, user_id, mutate, expected_version=None):
+        seen = {}
+
+        def observed(current):
+            seen["old"] = current
+            return mutate(current)
+
+        record = self.store.update(user_id, observed, expected_version)
+        self.observer.record_writes([(seen.get("old"), record["data"])])
+        return record
+
+    def put(self, user_id, data, expected_version=None):
+        return self.update(user_id, lambda _: data, expected_version)
+
+    def import_records(self, records):
+        old = [self.store.get(user_id) for user_id, _ in records]
+        self.store.import_records(records)
+        self.observer.record_writes(
+            (previous["data"] if previous else None, record["data"])
+            for previous, (_, record) in zip(old, records)
+        )
+
+    def export_rows(self):
+        return self.store.export_rows()
+
+    def user_ids(self):
+        return self.store.user_ids()
+
+
+class CachedSyncStore:
+    stats_key = "hot_cache"
+
+    # LRU of parsed documents bounded by their serialized size. Every hit is
+    # confirmed with a version lookup against the backing store (a primary-key
+    # read that skips the data column), so entries written by another worker
+    # process are never served stale; only the parse and decompression are
+    # saved.
+    def __init__(self, store, max_bytes=32 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def _remember(self, user_id, record):
+        size = len(json.dumps(record["data"], separators=(',', ':')))
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[user_id] = (dict(record), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.counters["evictions"] += 1
+
+    def _forget(self, user_id):
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None:
+            if self.store.version(user_id) == entry[0]["version"]:
+                with self._lock:
+                    if user_id in self._entries:
+                        self._entries.move_to_end(user_id)
+                    self.counters["hits"] += 1
+                return dict(entry[0])
+            with self._lock:
+                self.counters["stale"] += 1
+        with self._lock:
+            self.counters["misses"] += 1
+        record = self.store.get(user_id)
+        if record is None:
+            self._forget(user_id)
+        else:
+            self._remember(user_id, record)
+        return record
+
+    def version(self, user_id):
+        return self.store.version(user_id)
+
+    def update(self, user_id, mutate, expected_version=None):
+        self._forget(user_id)
+        record = self.store.update(user_id, mutate, expected_version)
+        self._remember(user_id, record)
+        return record
+
+    def put(self, user_id, data, expected_version=None):
+        return self.update(user_id, lambda _: data, expected_version)
+
+    def import_records(self, records):
+        self.store.import_records(records)
+        for user_id, _ in records:
+            self._forget(user_id)
+
+    def export_rows(self):
+        return self.store.export_rows()
+
+    def user_ids(self):
+        return self.store.user_ids()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["entries"] = len(self._entries)
+            counters["bytes"] = self._bytes
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else None
+        counters["max_bytes"] = self.max_bytes
+        return counters
+
+
+class TimedSyncStore:
+    # Reports how long each read and write takes, as seen by the request
+    # handlers (cache hits included), to a timer with an
+    # observe(seconds, operation) method.
+    def __init__(self, store, timer):
+        self.store = store
+        self.timer = timer
+
+    def _timed(self, operation, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timer.observe(time.perf_counter() - start, operation)
+
+    def get(self, user_id):
+        return self._timed("read", self.store.get, user_id)
+
+    def version(self, user_id):
+        return self._timed("version", self.store.version, user_id)
+
+    def update(self, user_id, mutate, expected_version=None):
+        return self._timed("write", self.store.update, user_id, mutate, expected_version)
+
+    def put(self, user_id, data, expected_version=None):
+        return self._timed("write", self.store.put, user_id, data, expected_version)
+
+    def import_records(self, records):
+        return self._timed("import", self.store.import_records, records)
+
+    def export_rows(self):
+        return self.store.export_rows()
+
+    def user_ids(self):
+        return self.store.user_ids()
+
+
+def sync_store_layers(store):
+    # Yields each wrapper and finally the backing store, outermost first.
+    while store is not None:
+        yield store
+        store = getattr(store, 'store', None)
+
+
+def sync_store_from_env(default_dir, observer=None, timer=None):
+    backend = os.environ.get("SYNC_BACKEND", "sqlite")
+    if backend == "json":
+        store = JsonFileSyncStore(default_dir)
+    elif backend == "sqlite":
+        store = SqliteSyncStore(
+            os.environ.get("SYNC_DB_PATH", os.path.join(default_dir, 'sync.sqlite3')),
+            codec=os.environ.get("SYNC_COMPRESSION", "auto")
+        )
+        import_legacy_json(default_dir, store)
+    else:
+        raise ValueError(f"Unknown SYNC_BACKEND {backend!r}")
+    flush_interval = float(os.environ.get("SYNC_WRITE_BEHIND_INTERVAL", "0"))
+    if flush_interval > 0:
+        # The buffer reports to the observer per flush; an ObservedSyncStore
+        # on top would write analytics on every buffered write.
+        store = WriteBehindSyncStore(
+            store,
+            flush_interval=flush_interval,
+            max_pending=int(os.environ.get("SYNC_WRITE_BEHIND_MAX_PENDING", "1000")),
+            observer=observer
+        )
+    elif observer is not None:
+        store = ObservedSyncStore(store, observer)
+    cache_bytes = int(os.environ.get("SYNC_CACHE_BYTES", str(32 * 1024 * 1024)))
+    if cache_bytes > 0:
+        store = CachedSyncStore(store, max_bytes=cache_bytes)
+    if timer is not None:
+        store = TimedSyncStore(store, timer)
+    return store
+
+
+def export_ndjson(store):
+    # One {"userId", "updatedAt", "version", "data"} object per line. The
+    # stored JSON is spliced in as-is rather than parsed and re-serialized.
+    for user_id, raw, updated_at, version in store.export_rows():
+        yield b''.join((
+            b'{"userId":', json.dumps(user_id).encode('utf-8'),
+            b',"updatedAt":', json.dumps(updated_at).encode('utf-8'),
+            b',"version":', str(int(version)).encode('ascii'),
+            b',"data":', raw, b'}\n'
+        ))
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def import_ndjson(store, lines, batch_size=1000):
+    imported = skipped = 0
+    batch = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+            user_id = entry["userId"]
+            record = {
+                "data": entry["data"],
+                "updatedAt": entry.get("updatedAt") or utc_now(),
+                "version": int(entry.get("version") or 1)
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Skipping NDJSON line %d: %s", number, e)
+            skipped += 1
+            continue
+        if not valid_user_id(user_id) or not isinstance(record["data"], dict):
+            logger.warning("Skipping NDJSON line %d: invalid userId or data", number)
+            skipped += 1
+            continue
+        batch.append((user_id, record))
+        if len(batch) >= batch_size:
+            store.import_records(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        store.import_records(batch)
+        imported += len(batch)
+    return {"imported": imported, "skipped": skipped}
+
+
+def migrate_json_files(source_dir, store, batch_size=500):
+    imported = skipped = 0
+    batch = []
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith('.json'):
+            continue
+        user_id = name[:-5]
+        try:
+            with open(os.path.join(source_dir, name), 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping %s: %s", name, e)
+            skipped += 1
+            continue
+        if not valid_user_id(user_id):
+            logger.warning("Skipping %s: invalid userId", name)
+            skipped += 1
+            continue
+        batch.append((user_id, record.get("data", {}), record.get("updatedAt") or utc_now()))
+        if len(batch) >= batch_size:
+            store.put_many(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        store.put_many(batch)
+        imported += len(batch)
+    return {"imported": imported, "skipped": skipped}
+
+
+def import_legacy_json(source_dir, store):
+    # Installs from before the SQLite backend kept <userId>.json files in the
+    # data directory. The first start against an empty database copies them
+    # in, so those users keep their data without a manual migrate.
+    if not os.path.isdir(source_dir) or next(store.user_ids(), None) is not None:
+        return None
+    if not any(name.endswith('.json') for name in os.listdir(source_dir)):
+        return None
+    summary = migrate_json_files(source_dir, store)
+    logger.warning("Imported %d legacy sync file(s) from %s into SQLite (%d skipped)",
+                   summary["imported"], source_dir, summary["skipped"])
+    return summary
+
+
+def main(argv=None):
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.sync_data')
+    parser = argparse.ArgumentParser(description="Manage the /api/sync storage backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Import <userId>.json files into the SQLite store")
+    migrate.add_argument("--source", default=default_dir, help="Directory holding <userId>.json files")
+    migrate.add_argument("--db", default=os.environ.get("SYNC_DB_PATH", os.path.join(default_dir, 'sync.sqlite3')))
+    recompress = sub.add_parser("recompress", help="Rewrite stored sync documents with the chosen codec")
+    recompress.add_argument("--db", default=os.environ.get("SYNC_DB_PATH", os.path.join(default_dir, 'sync.sqlite3')))
+    recompress.add_argument("--codec", choices=["auto", "zstd", "gzip", "raw"], default=os.environ.get("SYNC_COMPRESSION", "auto"))
+    export = sub.add_parser("export", help="Stream every sync document as NDJSON")
+    export.add_argument("--db", default=os.environ.get("SYNC_DB_PATH", os.path.join(default_dir, 'sync.sqlite3')))
+    export.add_argument("--output", default="-", help="Output file; a .gz suffix writes gzip (default: stdout)")
+    restore = sub.add_parser("import", help="Load an NDJSON (or .gz) export in batched transactions")
+    restore.add_argument("--db", default=os.environ.get("SYNC_DB_PATH", os.path.join(default_dir, 'sync.sqlite3')))
+    restore.add_argument("--input", default="-", help="Input file, plain or gzip (default: stdin)")
+    restore.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        chunks = export_ndjson(SqliteSyncStore(args.db))
+        if args.output.endswith('.gz'):
+            chunks = gzip_stream(chunks)
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        return 0
+
+    if args.command == "import":
+        raw = sys.stdin.buffer if args.input == "-" else open(args.input, 'rb')
+        source = gzip.GzipFile(fileobj=raw) if raw.peek(2)[:2] == b'\x1f\x8b' else raw
+        try:
+            summary = import_ndjson(SqliteSyncStore(args.db), source, batch_size=args.batch_size)
+        finally:
+            raw.close()
+        print(json.dumps(summary))
+        return 1 if summary["skipped"] else 0
+
+    if args.command == "recompress":
+        store = SqliteSyncStore(args.db, codec=args.codec)
+        summary = store.recompress()
+        summary["by_codec"] = store.storage_stats()
+        print(json.dumps(summary))
+        return 0
+
+    summary = migrate_json_files(args.source, SqliteSyncStore(args.db))
+    print(json.dumps(summary))
+    return 1 if summary["skipped"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
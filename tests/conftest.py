@@ -0,0 +1,61 @@
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+import pytest
+
+
+# server.py opens its stores and picks an LLM provider at import time, so the
+# scratch locations have to be in the environment before any test imports it.
+SCRATCH_DIR = tempfile.mkdtemp(prefix='az104-tests-')
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+
+ADMIN_TOKEN = "test-admin-token"
+
+os.environ.update({
+    "SYNC_DB_PATH": os.path.join(SCRATCH_DIR, 'sync.sqlite3'),
+    "ANALYTICS_DB_PATH": os.path.join(SCRATCH_DIR, 'analytics.sqlite3'),
+    "CPRS_BANK_PATH": os.path.join(SCRATCH_DIR, 'cprs_bank.sqlite3'),
+    "LLM_CACHE_DIR": os.path.join(SCRATCH_DIR, 'llm_cache'),
+    "STATIC_BUILD_DIR": os.path.join(SCRATCH_DIR, 'static_build'),
+    "LLM_PROVIDER": "fake",
+    "FAKE_LLM_LATENCY": "0",
+    "FAKE_LLM_FAILURE_RATE": "0",
+    "SYNC_WRITE_BEHIND_INTERVAL": "0",
+    "ADMIN_TOKEN": ADMIN_TOKEN,
+})
+for name in ("METRICS_DIR", "METRICS_TOKEN", "OPENAI_API_KEY"):
+    os.environ.pop(name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client():
+    import server
+    return server.app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    # Installs a fresh fake provider (own breaker and retry budget) as the
+    # server's LLM provider for one test; returns the unwrapped fake.
+    import server
+    from llm_providers import FakeProvider, ResilientProvider, RetryBudget, CircuitBreaker
+
+    def install(latency=0.0, failure_rate=0.0, provider=None, max_retries=0):
+        fake = provider or FakeProvider(latency, failure_rate, seed=7, concept_finder=server.extract_concepts_from_text)
+        resilient = ResilientProvider(fake, max_retries=max_retries, backoff_base=0.0,
+                                      budget=RetryBudget(), breaker=CircuitBreaker(failure_threshold=1000))
+        monkeypatch.setattr(server, "llm_provider", resilient)
+        return fake
+
+    install()
+    return install
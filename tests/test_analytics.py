@@ -0,0 +1,62 @@
+import uuid
+
+import server
+from analytics import ObjectiveAnalytics, document_counts, objective_ids
+
+
+KNOWN = objective_ids(server.AZ104_OBJECTIVES)
+
+
+def scores(**by_key):
+    return {"mergedQuizScores": {key.replace('_', ' '): {"correct": c, "total": t} for key, (c, t) in by_key.items()}}
+
+
+def test_document_counts_map_domains_and_objective_ids():
+    document = {"mergedQuizScores": {
+        "Networking": {"correct": 3, "total": 4},
+        "Compute": {"correct": 1, "total": 2},
+        "App Service & Containers": {"correct": 2, "total": 2},
+        "1.2": {"correct": 9, "total": 5},
+        "Unknown": {"correct": 1, "total": 1},
+        "Storage": {"correct": -1, "total": "10"},
+    }}
+    assert document_counts(document, KNOWN) == {"4": (3, 4), "3": (3, 4), "1.2": (5, 5)}
+    assert document_counts(None, KNOWN) == {}
+
+
+def test_incremental_counters_match_a_rebuild(tmp_path):
+    analytics = ObjectiveAnalytics(str(tmp_path / 'analytics.sqlite3'), server.AZ104_OBJECTIVES)
+    first = scores(Networking=(1, 4))
+    second = scores(Networking=(3, 4), Storage=(2, 2))
+    other = scores(Networking=(0, 2))
+    analytics.record_writes([(None, first), (None, other)])
+    analytics.record_write(first, second)
+    analytics.record_write(other, {})
+
+    incremental = {k: dict(v, updatedAt=None) for k, v in analytics.counters().items()}
+    assert incremental["4"] == {"correct": 3, "total": 4, "users": 1, "updatedAt": None}
+
+    assert analytics.rebuild([second, {}]) == {"users": 2, "objectives": 2}
+    rebuilt = {k: dict(v, updatedAt=None) for k, v in analytics.counters().items()}
+    assert {k: v for k, v in incremental.items() if v["total"] or v["users"]} == rebuilt
+
+
+def test_report_lists_the_weakest_objectives_first(tmp_path):
+    analytics = ObjectiveAnalytics(str(tmp_path / 'analytics.sqlite3'), server.AZ104_OBJECTIVES)
+    analytics.record_write(None, scores(Networking=(1, 4), Storage=(3, 4)))
+    report = analytics.report()
+    assert report["weakest"] == ["4", "2"]
+    networking = next(d for d in report["domains"] if d["id"] == "4")
+    assert networking["accuracy"] == 0.25 and networking["users"] == 1
+
+
+def test_sync_writes_feed_the_analytics_route(client):
+    def monitoring():
+        report = client.get('/api/analytics/objectives').get_json()
+        return next(d for d in report["domains"] if d["id"] == "5")
+
+    before = monitoring()
+    user_id = f"user-{uuid.uuid4().hex[:12]}"
+    client.put('/api/sync', json={"userId": user_id, "data": scores(Monitoring=(2, 5))})
+    after = monitoring()
+    assert (after["correct"] - before["correct"], after["total"] - before["total"], after["users"] - before["users"]) == (2, 5, 1)
@@ -0,0 +1,80 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+import asgi
+import server
+from llm_providers import FakeProvider
+
+
+def run(*requests):
+    # Sends (method, path, json) requests concurrently through the ASGI app.
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await asyncio.gather(*(client.request(method, path, json=body) for method, path, body in requests))
+    return asyncio.run(main())
+
+
+class CountingFake(FakeProvider):
+    # Counts coroutine calls and how many overlap.
+    def __init__(self):
+        super().__init__(latency=0.02, concept_finder=server.extract_concepts_from_text)
+        self.calls = self.active = self.peak = 0
+
+    async def acomplete(self, messages, max_tokens, timeout=None, usage=None):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await super().acomplete(messages, max_tokens, timeout=timeout, usage=usage)
+        finally:
+            self.active -= 1
+
+
+def test_async_extract_matches_the_flask_route(client, fake_llm):
+    text = f"Review {uuid.uuid4().hex}: you picked Azure Firewall but the answer was NSG."
+    (response,) = run(("POST", "/api/extract-concepts", {"text": text}))
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert [c["name"] for c in response.json()["concepts"]] == ["Azure Firewall", "NSG"]
+    assert client.post('/api/extract-concepts', json={"text": text}).get_json()["cached"] is True
+
+
+def test_identical_async_requests_share_one_model_call(fake_llm):
+    provider = fake_llm(provider=CountingFake())
+    concept = f"Concept {uuid.uuid4().hex[:8]}"
+    responses = run(*[("POST", "/api/generate-cprs", {"concept": concept, "mode": "live"})] * 3)
+    assert [r.json()["source"] for r in responses] == ["live"] * 3
+    assert provider.calls == 1
+
+
+def test_async_chunked_extract_caps_concurrent_calls(fake_llm, monkeypatch):
+    provider = fake_llm(provider=CountingFake())
+    monkeypatch.setattr(server, "EXTRACT_CHUNK_CHARS", 300)
+    monkeypatch.setattr(asgi, "fanout_slots", asyncio.Semaphore(2))
+    text = "".join(f"Question {n}: {uuid.uuid4().hex} NSG or Azure Firewall? " + "Explanation. " * 15 + "\n"
+                   for n in range(1, 6))
+    (response,) = run(("POST", "/api/extract-concepts", {"text": text}))
+    body = response.json()
+    assert body["chunks"] == 5 and "partial" not in body
+    assert provider.calls == 6 and provider.peak <= 2
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/extract-concepts", {"text": 42}),
+    ("/api/extract-concepts", ["text"]),
+    ("/api/generate-cprs", {"concept": "NSG", "objective": 4.1}),
+    ("/api/generate-cprs", {"concept": ["NSG"]}),
+])
+def test_async_routes_validate_their_input(path, body):
+    (response,) = run(("POST", path, body))
+    assert response.status_code == 400
+
+
+def test_other_routes_fall_through_to_flask():
+    (health, sync) = run(("GET", "/healthz", None), ("GET", "/api/sync?userId=nobody", None))
+    assert health.json()["status"] == "ok"
+    assert sync.json() == {"found": False}
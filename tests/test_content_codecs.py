@@ -0,0 +1,90 @@
+import gzip
+import json
+import uuid
+
+import pytest
+
+from content_codecs import (encode_payload, decode_payload, payload_codec, negotiate_encoding, compress_body,
+                            decompress_body, zstd_available, CompressionError, UnsupportedEncoding)
+from sync_store import SqliteSyncStore
+
+
+DOCUMENT = json.dumps({"mergedQuizScores": {f"Domain {n}": {"correct": n, "total": 10} for n in range(40)}}).encode()
+
+CODECS = ["raw", "gzip"] + (["zstd"] if zstd_available() else [])
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_payloads_round_trip_and_name_their_codec(codec):
+    blob = encode_payload(DOCUMENT, codec)
+    assert decode_payload(blob) == DOCUMENT
+    assert payload_codec(blob) == codec
+    if codec != "raw":
+        assert len(blob) < len(DOCUMENT)
+
+
+def test_small_payloads_are_stored_raw():
+    assert payload_codec(encode_payload(b'{"n": 1}', "gzip")) == "raw"
+
+
+def test_rows_from_before_compression_still_decode():
+    assert decode_payload('{"n": 1}') == b'{"n": 1}'
+    assert decode_payload(b'{"n": 1}') == b'{"n": 1}'
+    assert payload_codec('{"n": 1}') == "legacy"
+    with pytest.raises(CompressionError):
+        decode_payload(b'\x09garbage')
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("gzip", "gzip"),
+    ("gzip;q=0.5, br;q=0.9", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("identity", None),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header, offered=("gzip",)) == expected
+
+
+def test_request_bodies_are_decompressed_within_the_limit():
+    body = compress_body(DOCUMENT, "gzip")
+    assert decompress_body(body, "gzip", len(DOCUMENT)) == DOCUMENT
+    with pytest.raises(CompressionError):
+        decompress_body(body, "gzip", len(DOCUMENT) - 1)
+    with pytest.raises(UnsupportedEncoding):
+        decompress_body(body, "compress", len(DOCUMENT))
+
+
+def test_sync_accepts_gzip_bodies_and_compresses_responses(client):
+    user_id = f"user-{uuid.uuid4().hex[:12]}"
+    payload = json.dumps({"userId": user_id, "data": json.loads(DOCUMENT)}).encode()
+    response = client.put('/api/sync', data=gzip.compress(payload), content_type='application/json',
+                          headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200
+
+    response = client.get(f'/api/sync?userId={user_id}', headers={"Accept-Encoding": "gzip"})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(gzip.decompress(response.get_data()))["data"] == json.loads(DOCUMENT)
+
+
+def test_sync_rejects_bad_request_encodings(client):
+    body = json.dumps({"userId": "user-a", "data": {}}).encode()
+    assert client.put('/api/sync', data=body, content_type='application/json',
+                      headers={"Content-Encoding": "gzip"}).status_code == 400
+    assert client.put('/api/sync', data=body, content_type='application/json',
+                      headers={"Content-Encoding": "compress"}).status_code == 415
+
+
+def test_recompress_rewrites_rows_without_touching_versions(tmp_path):
+    path = str(tmp_path / 'sync.sqlite3')
+    SqliteSyncStore(path, codec="raw").put("user-a", json.loads(DOCUMENT))
+    store = SqliteSyncStore(path, codec="gzip")
+    assert store.storage_stats().keys() == {"raw"}
+
+    summary = store.recompress()
+    assert summary["rewritten"] == 1 and summary["bytes_after"] < summary["bytes_before"]
+    assert store.storage_stats().keys() == {"gzip"}
+    assert store.get("user-a")["data"] == json.loads(DOCUMENT)
+    assert store.version("user-a") == 1
@@ -0,0 +1,110 @@
+import sqlite3
+import uuid
+
+import pytest
+
+import server
+from cprs_bank import CprsBank, pregenerate
+from llm_providers import FakeProvider
+
+
+class StandInOpenAI(FakeProvider):
+    name = "openai"
+
+
+def unique_concept():
+    return f"Concept {uuid.uuid4().hex[:8]}"
+
+
+def test_fake_sets_are_not_served_to_other_providers(client, fake_llm):
+    concept = unique_concept()
+    live = client.post('/api/generate-cprs', json={"concept": concept}).get_json()
+    assert live["source"] == "live" and len(live["questions"]) == 6
+    assert client.post('/api/generate-cprs', json={"concept": concept, "mode": "bank"}).get_json()["source"] == "bank"
+
+    fake_llm(provider=StandInOpenAI())
+    response = client.post('/api/generate-cprs', json={"concept": concept, "mode": "bank"})
+    assert response.status_code == 404
+
+
+def test_streamed_fake_sets_are_banked_under_the_fake_provider(client, fake_llm):
+    concept = unique_concept()
+    body = client.post('/api/generate-cprs/stream', json={"concept": concept}).get_data(as_text=True)
+    assert '"source": "live"' in body
+    assert server.cprs_bank.has(concept, provider="fake")
+    assert not server.cprs_bank.has(concept)
+
+
+@pytest.mark.parametrize("route", ['/api/generate-cprs', '/api/generate-cprs/stream'])
+@pytest.mark.parametrize("body", [
+    {"concept": "NSG", "objective": 1.2},
+    {"concept": "NSG", "objective": ["1.2"]},
+    {"concept": 42},
+    ["NSG"],
+])
+def test_malformed_cprs_requests_get_400(client, route, body):
+    response = client.post(route, json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_objective_string_selects_the_banked_set(client, fake_llm):
+    concept = unique_concept()
+    client.post('/api/generate-cprs', json={"concept": concept})
+    response = client.post('/api/generate-cprs', json={"concept": concept, "objective": "", "mode": "bank"})
+    assert response.status_code == 200
+
+
+def test_bank_migrates_sets_stored_before_the_provider_column(tmp_path):
+    path = str(tmp_path / "bank.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE cprs_sets (
+          concept_key TEXT NOT NULL, objective TEXT NOT NULL DEFAULT '', concept TEXT NOT NULL,
+          payload TEXT NOT NULL, created_at TEXT NOT NULL, PRIMARY KEY (concept_key, objective));
+        INSERT INTO cprs_sets VALUES ('vnet', '4.1', 'VNet', '{"questions": [1]}', '2026-01-01T00:00:00Z');
+    """)
+    conn.close()
+
+    bank = CprsBank(path)
+    assert bank.get("VNet", "4.1") == {"questions": [1]}
+    assert bank.get("VNet", "4.1", provider="fake") is None
+    assert bank.stats()["by_provider"] == {"openai": 1}
+    assert CprsBank(path).get("vnet") == {"questions": [1]}
+
+
+def test_bank_keys_normalize_concept_and_objective(tmp_path):
+    bank = CprsBank(str(tmp_path / "bank.sqlite3"))
+    bank.put("Key Vault", {"questions": [1], "objective": "1.3 Manage secrets"})
+    assert bank.get("  key-vault ") == {"questions": [1], "objective": "1.3 Manage secrets"}
+    assert bank.has("KEY VAULT", "1.3")
+    assert not bank.has("Key Vault", "2.1")
+    assert bank.stats()["by_objective"] == {"1.3": 1}
+
+
+def test_pregenerate_skips_stored_sets_and_counts_failures(tmp_path, capsys):
+    bank = CprsBank(str(tmp_path / "bank.sqlite3"))
+    bank.put("NSG", {"questions": [1]}, "4.2", provider="fake")
+
+    def backend(concept):
+        if concept == "Broken":
+            raise RuntimeError("model unavailable")
+        return {"questions": [] if concept == "Empty" else [concept]}
+
+    targets = [("NSG", "4.2"), ("VNet", "4.1"), ("Broken", None), ("Empty", None)]
+    summary = pregenerate(bank, backend, targets, provider="fake")
+    assert summary == {"generated": 1, "skipped": 1, "failed": 2}
+    assert bank.get("VNet", "4.1", provider="fake") == {"questions": ["VNet"]}
+    assert pregenerate(bank, backend, targets[:2], force=True, provider="fake")["generated"] == 2
+
+
+def test_bank_mode_serves_stored_sets_without_a_model_call(client, fake_llm):
+    concept = unique_concept()
+    server.cprs_bank.put(concept, {"concept": concept, "questions": ["stored"]}, "2.1", provider="fake")
+    fake_llm(failure_rate=1.0)
+
+    body = client.post('/api/generate-cprs', json={"concept": concept, "objective": "2.1"}).get_json()
+    assert body["source"] == "bank"
+    assert body["questions"] == ["stored"]
+    assert "guide_references" in body
+    assert client.post('/api/generate-cprs', json={"concept": unique_concept(), "mode": "bank"}).status_code == 404
@@ -0,0 +1,72 @@
+import json
+import uuid
+
+import pytest
+
+from server import CprsQuestionStream
+
+
+QUESTIONS = [
+    {"type": "Foundation", "question": "Why do {braces} and \"quotes\" matter?", "answer": "A"},
+    {"type": "Scenario", "question": "Pick [one]", "answer": "B", "options": [{"id": 1}]},
+]
+DOCUMENT = json.dumps({
+    "concept": "VNet",
+    "objective": "4.1",
+    "notes": {"questions": [{"ignored": True}]},
+    "questions": QUESTIONS,
+})
+
+
+def feed_in_pieces(text, size):
+    parser = CprsQuestionStream()
+    seen = []
+    for start in range(0, len(text), size):
+        seen.extend(parser.feed(text[start:start + size]))
+    return parser, seen
+
+
+@pytest.mark.parametrize("size", [1, 3, 17, len(DOCUMENT)])
+def test_question_stream_yields_each_question_once(size):
+    parser, seen = feed_in_pieces(DOCUMENT, size)
+    assert seen == QUESTIONS
+    assert parser.result()["objective"] == "4.1"
+
+
+def test_question_stream_emits_questions_before_the_document_ends():
+    cut = DOCUMENT.index('{"type": "Scenario"')
+    parser = CprsQuestionStream()
+    assert parser.feed(DOCUMENT[:cut]) == QUESTIONS[:1]
+    assert parser.feed(DOCUMENT[cut:]) == QUESTIONS[1:]
+
+
+
+def read_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_route_sends_each_question_then_done(client, fake_llm):
+    concept = f"Concept {uuid.uuid4().hex[:8]}"
+    response = client.post('/api/generate-cprs/stream', json={"concept": concept, "mode": "live"})
+    assert response.mimetype == 'text/event-stream'
+    events = read_events(response)
+    assert [name for name, _ in events] == ["question"] * 6 + ["done"]
+    assert [payload["index"] for _, payload in events[:-1]] == list(range(6))
+    assert events[-1][1]["source"] == "live"
+
+    banked = read_events(client.post('/api/generate-cprs/stream', json={"concept": concept}))
+    assert banked[-1][1]["source"] == "bank"
+    assert [p for _, p in banked[:-1]] == [p for _, p in events[:-1]]
+
+
+def test_stream_route_reports_model_failures_as_an_error_event(client, fake_llm):
+    fake_llm(failure_rate=1.0)
+    events = read_events(client.post('/api/generate-cprs/stream', json={"concept": "VNet", "mode": "live"}))
+    assert len(events) == 1
+    name, payload = events[0]
+    assert name == "error"
+    assert payload["fallback"] is True and payload["questions"] == []
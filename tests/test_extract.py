@@ -0,0 +1,131 @@
+import uuid
+import threading
+
+import pytest
+
+import server
+from llm_providers import FakeProvider, LLMProviderError
+from server import split_review
+
+
+def test_split_review_keeps_short_reviews_whole():
+    text = "1. QUESTION\nWhat is RBAC?\n2. QUESTION\nWhat is a VNet?"
+    assert split_review(text, chunk_chars=1000) == [text]
+
+
+def test_split_review_cuts_on_question_headers():
+    questions = [f"Question {n}: " + "word " * 30 + "\n" for n in range(1, 7)]
+    chunks = split_review("".join(questions), chunk_chars=400)
+    assert "".join(chunks) == "".join(questions)
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    for chunk in chunks:
+        assert chunk.startswith("Question ")
+
+
+def test_split_review_splits_an_oversized_question_on_whitespace():
+    text = "Q1. " + "explanation " * 200
+    chunks = split_review(text, chunk_chars=500)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "".join(chunks) == text
+    assert all(chunk.startswith(" ") for chunk in chunks[1:])
+
+
+class CountingProvider(FakeProvider):
+    # Fake provider that records how many calls overlap.
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        super().__init__(latency, failure_rate, seed=7, concept_finder=server.extract_concepts_from_text)
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._count_lock = threading.Lock()
+
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        with self._count_lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().complete(messages, max_tokens, timeout=timeout, usage=usage)
+        finally:
+            with self._count_lock:
+                self.active -= 1
+
+
+def long_review(questions, nonce=None):
+    nonce = nonce or uuid.uuid4().hex
+    return "".join(
+        f"Question {n}: review {nonce} asked which option protects a subnet. "
+        f"You picked Azure Firewall but the answer was NSG. " + "Explanation follows. " * 6 + "\n"
+        for n in range(1, questions + 1)
+    )
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(server, "EXTRACT_CHUNK_CHARS", 300)
+
+
+def test_concurrent_chunked_reviews_wait_for_fanout_slots(client, fake_llm, small_chunks, monkeypatch):
+    provider = fake_llm(provider=CountingProvider(latency=0.05))
+    monkeypatch.setattr(server, "extract_fanout_slots", threading.BoundedSemaphore(3))
+    results = [None, None]
+
+    def post(index):
+        response = server.app.test_client().post('/api/extract-concepts', json={"text": long_review(6)})
+        results[index] = response.get_json()
+
+    threads = [threading.Thread(target=post, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    for result in results:
+        assert result["chunks"] == 6
+        assert "partial" not in result and "fallback" not in result
+        assert [c["name"] for c in result["concepts"]] == ["Azure Firewall", "NSG"]
+        assert result["summary"] == "Focus on 2 weak concept(s) using the CPRS structure."
+    assert provider.calls == 2 * (6 + 1)
+    assert provider.peak <= 3
+
+
+class StandInOpenAI(FakeProvider):
+    # Answers like the fake but under the OpenAI provider's name.
+    name = "openai"
+
+
+def test_cached_results_are_kept_per_provider(client, fake_llm):
+    text = long_review(1)
+    first = client.post('/api/extract-concepts', json={"text": text}).get_json()
+    assert "cached" not in first
+    assert client.post('/api/extract-concepts', json={"text": text}).get_json()["cached"] is True
+
+    fake_llm(provider=StandInOpenAI(concept_finder=server.extract_concepts_from_text))
+    assert "cached" not in client.post('/api/extract-concepts', json={"text": text}).get_json()
+
+
+
+class FailsOnQuestion(FakeProvider):
+    # Fails the chunk holding the given question header.
+    def __init__(self, header):
+        super().__init__(concept_finder=server.extract_concepts_from_text)
+        self.header = header
+
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        if self.header in messages[-1]["content"].split("Quiz review content:")[-1]:
+            raise LLMProviderError("chunk failed")
+        return super().complete(messages, max_tokens, timeout=timeout, usage=usage)
+
+
+def test_failed_chunks_give_a_partial_result_that_is_not_cached(client, fake_llm, small_chunks):
+    text = long_review(3)
+    fake_llm(provider=FailsOnQuestion("Question 2:"))
+    result = client.post('/api/extract-concepts', json={"text": text}).get_json()
+    assert result["partial"] is True
+    assert result["chunks"] == 3 and result["failed_chunks"] == 1
+    assert [c["name"] for c in result["concepts"]] == ["Azure Firewall", "NSG"]
+
+    fake_llm()
+    retried = client.post('/api/extract-concepts', json={"text": text}).get_json()
+    assert "partial" not in retried and "cached" not in retried
@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize("body", [["a review"], "a review", 3])
+def test_batch_rejects_bodies_that_are_not_objects(client, body):
+    response = client.post('/api/extract-concepts/batch', json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_batch_returns_one_result_per_text(client, fake_llm):
+    texts = [
+        "You picked Azure Firewall but the answer was NSG.",
+        "Question about RBAC role assignments at the subscription scope.",
+    ]
+    response = client.post('/api/extract-concepts/batch', json={"texts": texts})
+    assert response.status_code == 200
+    items = response.get_json()["items"]
+    assert len(items) == 2
+    assert "NSG" in [c["name"] for c in items[0]["concepts"]]
@@ -0,0 +1,43 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def guide_tables(monkeypatch):
+    # Private copies so edits made by a test do not leak into others.
+    monkeypatch.setattr(server, "GUIDE_INDEX", dict(server.GUIDE_INDEX))
+    monkeypatch.setattr(server, "GUIDE_ALIASES", {k: list(v) for k, v in server.GUIDE_ALIASES.items()})
+    server.rebuild_guide_index()
+    yield
+    monkeypatch.undo()
+    server.rebuild_guide_index()
+
+
+def guides_for(concept):
+    return [ref["guide"] for ref in server.find_guide_references([concept])]
+
+
+def test_aliases_and_plurals_resolve_to_the_same_guide():
+    assert guides_for("NSGs") == guides_for("Network Security Groups") != []
+    assert guides_for("Microsoft Quantum Widgets") == []
+
+
+def test_index_follows_in_place_edits_of_the_same_size(guide_tables):
+    key = "Azure Site Recovery"
+    guide = server.GUIDE_INDEX[key]["file"]
+    assert guides_for("ASR") == [guide]
+
+    server.GUIDE_ALIASES[key] = ["Disaster Failover"]
+    assert guides_for("ASR") == []
+    assert guides_for("Disaster Failover") == [guide]
+
+    # Same number of guides, different key.
+    server.GUIDE_INDEX["Azure Recovery"] = server.GUIDE_INDEX.pop(key)
+    server.GUIDE_ALIASES["Azure Recovery"] = server.GUIDE_ALIASES.pop(key)
+    assert guides_for("Disaster Failover") == [guide]
+
+
+def test_register_guide_makes_new_aliases_resolvable(guide_tables):
+    server.register_guide("Azure Chaos Studio", "chaos-studio.html", "Experiments", ["Fault Injection"])
+    assert guides_for("fault injection") == ["chaos-studio.html"]
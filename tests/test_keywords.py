@@ -0,0 +1,26 @@
+import pytest
+
+import server
+from server import extract_concepts_from_text
+
+
+def test_keywords_match_plurals_but_not_inside_words():
+    text = "Configure NSGs on both VNets, rotate the SAS tokens and use Key Vaults. Apply the hotfix graciously."
+    assert extract_concepts_from_text(text) == ["NSG", "VNet", "SAS Token", "Key Vault"]
+
+
+@pytest.mark.parametrize("text", ["Two ACIes", "hotes", "VNetes", "NSGes"])
+def test_es_plural_needs_a_sibilant_ending(text):
+    assert extract_concepts_from_text(text) == []
+
+
+def test_sibilant_keywords_take_es_plurals():
+    pattern, lookup, _ = server.build_keyword_matcher(["Box", "Branch", "Mesh", "Access", "ACI"])
+    found = [lookup[name] for name in pattern.findall(" boxes, branches, meshes, accesses, acis, accesss")]
+    assert found == ["Box", "Branch", "Mesh", "Access", "ACI"]
+
+
+def test_keyword_offsets_point_at_the_original_text():
+    text = "İ VNet Peering and NSGs"
+    spans = [(m["concept"], text[m["start"]:m["end"]]) for m in server.find_concept_matches(text)]
+    assert spans == [("VNet", "VNet"), ("VNet Peering", "VNet Peering"), ("NSG", "NSGs")]
@@ -0,0 +1,204 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import llm_providers
+from llm_providers import (FakeProvider, LLMProviderError, CircuitOpenError, OpenAIProvider, ResilientProvider,
+                           RetryBudget, CircuitBreaker, make_mock_handler, provider_from_env)
+
+
+def cprs_messages(concept):
+    return [{"role": "user", "content": f'Generate 6 SEPARATE multiple-choice questions (MCQ) for: "{concept}"'}]
+
+
+def extract_messages(review):
+    return [{"role": "user", "content": f"Analyze this.\n\nQuiz review content:\n{review}"}]
+
+
+def find_nsg(text):
+    return ["NSG"] if "NSG" in text else []
+
+
+def test_fake_answers_are_deterministic_and_schema_shaped():
+    fake = FakeProvider(concept_finder=find_nsg)
+    cprs = json.loads(fake.complete(cprs_messages("Key Vault"), 100))
+    assert cprs["concept"] == "Key Vault"
+    assert [q["correct"] for q in cprs["questions"]] == ["A"] * 6
+    assert fake.complete(cprs_messages("Key Vault"), 100) == json.dumps(cprs)
+
+    extracted = json.loads(fake.complete(extract_messages("Picked ASG, answer was NSG"), 100))
+    assert [c["name"] for c in extracted["concepts"]] == ["NSG"]
+
+
+def test_fake_stream_reassembles_to_the_completion_and_reports_usage():
+    fake = FakeProvider()
+    usage = {}
+    chunks = list(fake.stream(cprs_messages("VNet"), 100, usage=usage))
+    assert len(chunks) > 1
+    assert json.loads("".join(chunks)) == json.loads(fake.complete(cprs_messages("VNet"), 100))
+    assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+
+
+def test_fake_failure_rate_is_injected():
+    with pytest.raises(LLMProviderError):
+        FakeProvider(failure_rate=1.0).complete(cprs_messages("VNet"), 100)
+
+
+def test_provider_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY", "0.25")
+    assert provider_from_env().latency == 0.25
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    assert provider_from_env() is None
+    monkeypatch.setenv("LLM_PROVIDER", "anthropic")
+    with pytest.raises(ValueError):
+        provider_from_env()
+
+
+@pytest.fixture
+def mock_openai():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_mock_handler(FakeProvider(concept_finder=find_nsg)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_openai_provider_talks_to_the_mock_api(mock_openai):
+    provider = OpenAIProvider("test-key", base_url=mock_openai)
+    usage = {}
+    cprs = json.loads(provider.complete(cprs_messages("Azure Bastion"), 100, usage=usage))
+    assert cprs["concept"] == "Azure Bastion"
+    assert usage["completion_tokens"] > 0
+
+    streamed = "".join(provider.stream(extract_messages("NSG"), 100))
+    assert [c["name"] for c in json.loads(streamed)["concepts"]] == ["NSG"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_providers.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10.0)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_allows_one_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10.0)
+    breaker.record_failure()
+    clock[0] += 9.9
+    assert not breaker.allow()
+    clock[0] += 0.1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, cooldown=10.0)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 10.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock[0] += 10.0
+    assert breaker.allow()
+
+
+def test_retry_budget_starts_with_min_tokens():
+    budget = RetryBudget(ratio=0.5, min_tokens=2.0, max_tokens=4.0)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_retry_budget_refills_by_ratio_up_to_max():
+    budget = RetryBudget(ratio=0.5, min_tokens=0.0, max_tokens=2.0)
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 2.0
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+
+class Flaky:
+    # Fails the first `failures` calls with `error`.
+    name = "flaky"
+
+    def __init__(self, failures, error=LLMProviderError("upstream 503")):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def complete(self, messages, max_tokens, timeout=None, usage=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def resilient(provider, **options):
+    options.setdefault("breaker", CircuitBreaker(failure_threshold=2, cooldown=60.0))
+    return ResilientProvider(provider, backoff_base=0.0, **options)
+
+
+def test_transient_failures_are_retried():
+    provider = resilient(Flaky(2), max_retries=2)
+    assert provider.complete([], 10) == "ok"
+    assert provider.stats()["retries"] == 2
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    flaky = Flaky(1, error=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        resilient(flaky, max_retries=2).complete([], 10)
+    assert flaky.calls == 1
+
+
+def test_empty_retry_budget_stops_retries():
+    flaky = Flaky(5)
+    provider = resilient(flaky, max_retries=3, budget=RetryBudget(ratio=0.0, min_tokens=0.0))
+    with pytest.raises(LLMProviderError):
+        provider.complete([], 10)
+    assert flaky.calls == 1
+    assert provider.stats()["budget_exhausted"] == 1
+
+
+def test_open_breaker_short_circuits_calls(clock):
+    flaky = Flaky(10)
+    provider = resilient(flaky, max_retries=0)
+    for _ in range(2):
+        with pytest.raises(LLMProviderError):
+            provider.complete([], 10)
+    with pytest.raises(CircuitOpenError):
+        provider.complete([], 10)
+    assert flaky.calls == 2
+    assert provider.stats()["circuit"] == "open"
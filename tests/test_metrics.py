@@ -0,0 +1,88 @@
+import os
+import re
+
+import server
+import metrics
+from metrics import Registry, SharedMetrics, render, histogram_quantile, merge_snapshots
+
+
+def scrape_value(text, sample):
+    match = re.search(r'^' + re.escape(sample) + r' (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_render_writes_cumulative_buckets_and_escapes_labels():
+    registry = Registry('test')
+    requests = registry.counter('requests_total', 'Requests.', ('route',))
+    latency = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+    requests.inc('/a"b')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, '/a')
+
+    text = render(registry.snapshot())
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{route="/a\\"b"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_sum{route="/a"} 5.55' in text
+    assert 'test_latency_seconds_count{route="/a"} 3' in text
+
+
+def test_histogram_quantile_interpolates_within_a_bucket():
+    buckets = (1.0, 2.0, 4.0)
+    assert histogram_quantile(buckets, [0, 10, 0, 0], 0.5) == 1.5
+    assert histogram_quantile(buckets, [0, 0, 0, 3], 0.99) == 4.0
+    assert histogram_quantile(buckets, [0, 0, 0, 0], 0.5) is None
+
+
+def test_worker_snapshots_add_up_and_survive_recycling(tmp_path):
+    directory = str(tmp_path)
+    first, second = Registry('test'), Registry('test')
+    counters = [r.counter('requests_total', 'Requests.', ('route',)) for r in (first, second)]
+    counters[0].inc('/a', amount=2)
+    counters[1].inc('/a', amount=3)
+
+    # A worker that has exited leaves its last snapshot behind.
+    departed = SharedMetrics(first, directory, interval=3600)
+    departed.close()
+    os.replace(departed.path, os.path.join(directory, 'metrics-99999.json'))
+    live = SharedMetrics(second, directory, interval=3600)
+    try:
+        assert live.snapshot()['test_requests_total']['series'] == {('/a',): 5}
+        metrics.retire(directory, 99999)
+        assert not os.path.exists(os.path.join(directory, 'metrics-99999.json'))
+        assert live.snapshot()['test_requests_total']['series'] == {('/a',): 5}
+    finally:
+        live.close()
+
+
+def test_merge_snapshots_adds_histograms():
+    registry = Registry('test')
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(1.0,))
+    latency.observe(0.5)
+    merged = merge_snapshots([registry.snapshot(), registry.snapshot()])
+    assert merged['test_latency_seconds']['series'][()] == [[2, 0], 1.0, 2]
+
+
+def test_metrics_endpoint_counts_requests_by_route(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    client.get('/healthz')
+    after = client.get('/metrics')
+    assert after.content_type == metrics.CONTENT_TYPE
+    sample = 'az104_http_request_duration_seconds_count{route="/healthz",method="GET",status="200"}'
+    assert scrape_value(after.get_data(as_text=True), sample) == scrape_value(before, sample) + 1
+
+
+def test_metrics_token_is_enforced_when_set(client, monkeypatch):
+    monkeypatch.setattr(server, "METRICS_TOKEN", "scrape-secret")
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+
+def test_admin_metrics_summary(client, admin_headers):
+    client.get('/healthz')
+    assert client.get('/api/admin/metrics').status_code == 403
+    summary = client.get('/api/admin/metrics', headers=admin_headers).get_json()
+    rows = summary['az104_http_request_duration_seconds']
+    assert any(row["route"] == "/healthz" and row["p95"] is not None for row in rows)
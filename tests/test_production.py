@@ -0,0 +1,50 @@
+import os
+import runpy
+
+import pytest
+
+import server
+
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+class BrokenStore:
+    def version(self, user_id):
+        raise OSError("database is locked")
+
+
+def test_healthz_reports_ok(client):
+    body = client.get('/healthz').get_json()
+    assert body["status"] == "ok"
+    assert body["checks"] == {"sync_store": "ok", "llm": "closed"}
+
+
+def test_healthz_fails_when_the_sync_store_does(client, monkeypatch):
+    monkeypatch.setattr(server, "sync_store", BrokenStore())
+    response = client.get('/healthz')
+    assert response.status_code == 503
+    assert response.get_json()["checks"]["sync_store"] == "error: database is locked"
+
+
+@pytest.fixture
+def gunicorn_env(monkeypatch, tmp_path):
+    # A preset METRICS_DIR stops the config from creating its own.
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("PORT", "8123")
+    return monkeypatch
+
+
+def test_gunicorn_config_reads_the_environment(gunicorn_env):
+    gunicorn_env.setenv("SYNC_WRITE_BEHIND_INTERVAL", "0")
+    config = runpy.run_path(CONFIG)
+    assert config["bind"] == "0.0.0.0:8123"
+    assert config["workers"] == 3
+    assert config["worker_class"] == "gthread"
+    assert config["preload_app"] is False
+
+
+def test_gunicorn_runs_one_worker_with_write_behind(gunicorn_env):
+    gunicorn_env.setenv("SYNC_WRITE_BEHIND_INTERVAL", "5")
+    assert runpy.run_path(CONFIG)["workers"] == 1
@@ -0,0 +1,47 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, content_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_content_key_ignores_whitespace_differences():
+    assert content_key("ns", "  NSG\n\tvs  ASG ") == content_key("ns", "NSG vs ASG")
+    assert content_key("ns", "NSG") != content_key("other", "NSG")
+
+
+def test_entries_survive_a_restart_and_memory_eviction(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), max_entries=1)
+    cache.put("key-aa", {"n": 1})
+    cache.put("key-bb", {"n": 2})
+    assert cache.stats()["entries"] == 1
+    assert cache.get("key-aa") == {"n": 1}
+    assert cache.counters["disk_hits"] == 1
+
+    restarted = ResponseCache(str(tmp_path))
+    assert restarted.get("key-bb") == {"n": 2}
+    assert restarted.get("key-cc") is None
+    assert restarted.stats()["hit_rate"] == 0.5
+
+
+def test_expired_entries_are_dropped(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=60)
+    cache.put("key-aa", {"n": 1})
+    clock[0] += 61
+    assert cache.get("key-aa") is None
+    assert ResponseCache(str(tmp_path), ttl_seconds=60).get("key-aa") is None
+    assert not list(tmp_path.rglob("*.json"))
+
+
+def test_admin_cache_routes_need_the_token(client, admin_headers):
+    assert client.get('/api/admin/cache').status_code == 403
+    assert client.delete('/api/admin/cache').status_code == 403
+    stats = client.get('/api/admin/cache', headers=admin_headers).get_json()
+    assert {"extract-concepts", "single-flight", "single-flight-async"} <= set(stats)
+    assert "purged" in client.delete('/api/admin/cache', headers=admin_headers).get_json()
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from single_flight import SingleFlight, AsyncSingleFlight
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    threads[0].start()
+    wait_until(lambda: flight.stats()["in_flight"] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.counters["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "errors": 0, "in_flight": 0}
+
+
+def test_waiters_receive_the_leaders_error():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    wait_until(lambda: flight.counters["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ["upstream down", "upstream down"]
+    assert flight.stats()["errors"] == 1
+
+
+def test_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    values = iter([1, 2])
+    assert flight.do("key", lambda: next(values)) == 1
+    assert flight.do("key", lambda: next(values)) == 2
+    with pytest.raises(ValueError):
+        flight.do("other", lambda: int("x"))
+    assert flight.stats() == {"executions": 3, "coalesced": 0, "errors": 1, "in_flight": 0}
+
+
+def test_async_callers_share_one_task():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", slow) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "errors": 0, "in_flight": 0}
+
+
+def test_async_caller_going_away_does_not_cancel_the_shared_call():
+    flight = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        impatient = asyncio.ensure_future(flight.do("key", slow))
+        patient = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(main()) == "answer"
+    assert flight.stats()["errors"] == 0
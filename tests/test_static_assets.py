@@ -0,0 +1,101 @@
+import gzip
+
+import pytest
+
+import server
+from content_codecs import brotli_available
+from static_assets import StaticSite, build, load_manifest, IMMUTABLE_CACHE, REVALIDATE_CACHE
+
+
+SCRIPT = "console.log('study hub');\n" * 80
+
+
+@pytest.fixture
+def source(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "js").mkdir(parents=True)
+    (docs / "js" / "app.js").write_text(SCRIPT)
+    (docs / "guide.html").write_text(
+        '<script src="js/app.js?v=1"></script><a href="https://example.com/js/app.js">x</a>'
+        '<img src="${icon}">'
+    )
+    (docs / "index.html").write_text('<script src="./js/app.js"></script>')
+    (docs / "notes.md").write_text("not published")
+    return docs
+
+
+@pytest.fixture
+def site(source, tmp_path, monkeypatch):
+    out = tmp_path / "build"
+    build(str(source), str(out))
+    site = StaticSite(str(source), str(out))
+    monkeypatch.setattr(server, "static_site", site)
+    return site
+
+
+def hashed_script(site):
+    return load_manifest(site.build_dir)["assets"]["js/app.js"]
+
+
+def test_build_fingerprints_assets_and_rewrites_pages(source, tmp_path):
+    out = tmp_path / "build"
+    summary = build(str(source), str(out))
+    assert summary["files"] == 3 and summary["assets"] == 1 and summary["pages_rewritten"] == 2
+
+    hashed = load_manifest(str(out))["assets"]["js/app.js"]
+    assert hashed.startswith("js/app.") and hashed.endswith(".js")
+    assert (out / hashed).read_text() == SCRIPT
+    guide = (out / "guide.html").read_text()
+    assert f'src="{hashed}?v=1"' in guide
+    assert 'https://example.com/js/app.js' in guide and '${icon}' in guide
+    assert not (out / "notes.md").exists()
+
+
+def test_cache_policy(site):
+    assert site.cache_policy(hashed_script(site))[1] == IMMUTABLE_CACHE
+    etag, cache_control = site.cache_policy("index.html")
+    assert etag and cache_control == REVALIDATE_CACHE
+
+
+def test_hashed_assets_are_served_immutable_and_pages_revalidate(client, site):
+    asset = client.get('/' + hashed_script(site))
+    assert asset.status_code == 200
+    assert asset.headers['Cache-Control'] == IMMUTABLE_CACHE
+
+    page = client.get('/')
+    assert page.headers['Cache-Control'] == REVALIDATE_CACHE
+    assert client.get('/', headers={"If-None-Match": page.headers['ETag']}).status_code == 304
+
+
+def test_without_a_build_files_come_from_the_source(client, source, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "static_site", StaticSite(str(source), str(tmp_path / "missing")))
+    response = client.get('/js/app.js')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == REVALIDATE_CACHE
+
+
+def test_build_precompresses_large_text_files(site):
+    encodings = load_manifest(site.build_dir)["encodings"]
+    hashed = hashed_script(site)
+    assert set(encodings[hashed]) == ({"identity", "gzip", "br"} if brotli_available() else {"identity", "gzip"})
+    assert encodings[hashed]["gzip"] < encodings[hashed]["identity"]
+    assert "index.html" not in encodings
+
+
+def test_rebuild_reuses_siblings_of_unchanged_files(source, site):
+    summary = build(str(source), site.build_dir)
+    assert summary["compressed"] == 0 and summary["reused"] > 0
+
+
+def test_precompressed_variants_are_negotiated(client, site):
+    path = '/' + hashed_script(site)
+    gzipped = client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzipped.mimetype in ('text/javascript', 'application/javascript')
+    assert gzip.decompress(gzipped.get_data()).decode() == SCRIPT
+    assert gzipped.headers['ETag'] != client.get(path).headers['ETag']
+
+    plain = client.get(path, headers={"Accept-Encoding": "identity"})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data(as_text=True) == SCRIPT
@@ -0,0 +1,126 @@
+import gzip
+import json
+import uuid
+
+import pytest
+
+
+def new_user():
+    return f"user-{uuid.uuid4().hex[:12]}"
+
+
+def test_put_returns_version_etag_and_get_revalidates(client):
+    user_id = new_user()
+    put = client.put('/api/sync', json={"userId": user_id, "data": {"n": 1}})
+    assert put.status_code == 200
+    assert put.headers['ETag'] == '"1"'
+
+    get = client.get(f'/api/sync?userId={user_id}')
+    assert get.get_json()["data"] == {"n": 1}
+    assert client.get(f'/api/sync?userId={user_id}', headers={"If-None-Match": get.headers['ETag']}).status_code == 304
+
+
+def test_stale_if_match_gets_412_with_the_current_version(client):
+    user_id = new_user()
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 1}})
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 2}}, headers={"If-Match": '"1"'})
+
+    response = client.put('/api/sync', json={"userId": user_id, "data": {"n": 3}}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert response.get_json()["version"] == 2
+    assert response.headers['ETag'] == '"2"'
+
+
+@pytest.mark.parametrize("method, body", [
+    ("put", {"data": {"n": 1}}),
+    ("patch", {"patch": {"n": 1}}),
+])
+def test_if_match_star_requires_an_existing_document(client, method, body):
+    user_id = new_user()
+    send = getattr(client, method)
+    response = send('/api/sync', json=dict(body, userId=user_id), headers={"If-Match": "*"})
+    assert response.status_code == 412
+    assert client.get(f'/api/sync?userId={user_id}').get_json()["found"] is False
+
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 0}})
+    response = send('/api/sync', json=dict(body, userId=user_id), headers={"If-Match": "*"})
+    assert response.status_code == 200
+    assert response.get_json()["version"] == 2
+
+
+def test_patch_applies_merge_patch_and_ops(client):
+    user_id = new_user()
+    client.put('/api/sync', json={"userId": user_id, "data": {"a": 1, "b": {"c": 2}}})
+    merged = client.patch('/api/sync', json={"userId": user_id, "patch": {"b": {"c": None, "d": 3}}},
+                          headers={"If-Match": '"1"'})
+    assert merged.status_code == 200
+    ops = client.patch('/api/sync', json={"userId": user_id, "ops": [{"op": "replace", "path": "/a", "value": 5}]},
+                       headers={"If-Match": merged.headers['ETag']})
+    assert ops.status_code == 200
+    assert client.get(f'/api/sync?userId={user_id}').get_json()["data"] == {"a": 5, "b": {"d": 3}}
+
+
+def test_patch_requires_if_match(client):
+    response = client.patch('/api/sync', json={"userId": new_user(), "patch": {"a": 1}})
+    assert response.status_code == 428
+
+
+def test_admin_sync_stats_name_the_backend(client, admin_headers):
+    assert client.get('/api/admin/sync').status_code == 403
+    stats = client.get('/api/admin/sync', headers=admin_headers).get_json()
+    assert stats["backend"] == "SqliteSyncStore"
+    assert "acquisitions" in stats["locks"]
+
+
+def test_invalid_patches_get_422_and_leave_the_document(client):
+    user_id = new_user()
+    client.put('/api/sync', json={"userId": user_id, "data": {"a": 1}})
+    response = client.patch('/api/sync', json={"userId": user_id, "ops": [{"op": "remove", "path": "/missing"}]},
+                            headers={"If-Match": '"1"'})
+    assert response.status_code == 422
+    assert client.patch('/api/sync', json={"userId": user_id, "patch": [1]}, headers={"If-Match": '"1"'}).status_code == 422
+    assert client.get(f'/api/sync?userId={user_id}').get_json()["version"] == 1
+
+
+@pytest.mark.parametrize("header, status", [
+    ('"2"', 304),
+    ('W/"2"', 304),
+    ('"1", "2"', 304),
+    ('*', 304),
+    ('"1"', 200),
+])
+def test_conditional_get(client, header, status):
+    user_id = new_user()
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 1}})
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 2}})
+    response = client.get(f'/api/sync?userId={user_id}', headers={"If-None-Match": header})
+    assert response.status_code == status
+    assert response.headers['ETag'] == '"2"'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    if status == 304:
+        assert response.get_data() == b''
+
+
+def test_conditional_get_for_a_missing_user_is_not_304(client):
+    response = client.get(f'/api/sync?userId={new_user()}', headers={"If-None-Match": '*'})
+    assert response.status_code == 200
+    assert response.get_json() == {"found": False}
+
+
+def test_admin_export_and_import_round_trip(client, admin_headers):
+    user_id = new_user()
+    client.put('/api/sync', json={"userId": user_id, "data": {"n": 1}})
+    assert client.get('/api/admin/sync/export').status_code == 403
+
+    export = client.get('/api/admin/sync/export', headers=dict(admin_headers, **{"Accept-Encoding": "gzip"}))
+    assert export.headers['Content-Encoding'] == 'gzip'
+    lines = [json.loads(line) for line in gzip.decompress(export.get_data()).splitlines()]
+    entry = next(line for line in lines if line["userId"] == user_id)
+    assert entry["data"] == {"n": 1} and entry["version"] == 1
+
+    body = gzip.compress(json.dumps(dict(entry, data={"n": "restored"})).encode() + b"\nnot json\n")
+    response = client.post('/api/admin/sync/import', data=body, headers=dict(admin_headers, **{"Content-Encoding": "gzip"}))
+    assert response.get_json() == {"imported": 1, "skipped": 1}
+    restored = client.get(f'/api/sync?userId={user_id}').get_json()
+    assert restored["data"] == {"n": "restored"}
+    assert restored["version"] == 2
@@ -0,0 +1,68 @@
+import uuid
+
+from sync_store import merge_sync_documents
+
+
+def device(domain_scores, history=()):
+    # domain_scores: {domain: (correct, total, lastUpdated)}
+    return {
+        "mergedQuizScores": {d: {"correct": c, "total": t} for d, (c, t, _) in domain_scores.items()},
+        "domainScoreMetadata": {d: {"lastUpdated": u} for d, (_, _, u) in domain_scores.items()},
+        "mergedQuizHistory": [{"takenAt": taken_at, "score": score} for taken_at, score in history],
+    }
+
+
+LAPTOP = device(
+    {"Identity": (8, 10, "2026-01-02T00:00:00Z"), "Storage": (3, 10, "2026-01-01T00:00:00Z")},
+    [("2026-01-01T00:00:00Z", 30), ("2026-01-02T00:00:00Z", 80)],
+)
+PHONE = device(
+    {"Identity": (5, 10, "2026-01-01T00:00:00Z"), "Storage": (9, 10, "2026-01-03T00:00:00Z"),
+     "Networking": (1, 4, "2026-01-03T00:00:00Z")},
+    [("2026-01-02T00:00:00Z", 80), ("2026-01-03T00:00:00Z", 90)],
+)
+
+
+def test_merge_is_commutative():
+    assert merge_sync_documents(LAPTOP, PHONE) == merge_sync_documents(PHONE, LAPTOP)
+
+
+def test_merge_is_idempotent():
+    merged = merge_sync_documents(LAPTOP, PHONE)
+    assert merge_sync_documents(merged, PHONE) == merged
+    assert merge_sync_documents(merged, merged) == merged
+
+
+def test_merge_keeps_newest_score_per_domain_and_unions_history():
+    merged = merge_sync_documents(LAPTOP, PHONE)
+    assert merged["mergedQuizScores"] == {
+        "Identity": {"correct": 8, "total": 10},
+        "Storage": {"correct": 9, "total": 10},
+        "Networking": {"correct": 1, "total": 4},
+    }
+    assert merged["domainScoreMetadata"]["Storage"] == {"lastUpdated": "2026-01-03T00:00:00Z"}
+    assert [s["takenAt"] for s in merged["mergedQuizHistory"]] == [
+        "2026-01-01T00:00:00Z", "2026-01-02T00:00:00Z", "2026-01-03T00:00:00Z"]
+
+
+def test_merge_caps_history():
+    merged = merge_sync_documents(LAPTOP, PHONE, history_max=2)
+    assert [s["score"] for s in merged["mergedQuizHistory"]] == [80, 90]
+
+
+def test_merge_takes_other_keys_from_incoming():
+    merged = merge_sync_documents({"theme": "dark", "keep": 1}, {"theme": "light"})
+    assert merged == {"theme": "light", "keep": 1}
+
+
+def test_merge_route_returns_the_merged_document(client):
+    user_id = f"user-{uuid.uuid4().hex[:12]}"
+    first = client.post('/api/sync/merge', json={"userId": user_id, "data": LAPTOP})
+    assert first.status_code == 200 and first.get_json()["version"] == 1
+
+    second = client.post('/api/sync/merge', json={"userId": user_id, "data": PHONE}).get_json()
+    assert second["data"] == merge_sync_documents(LAPTOP, PHONE)
+    assert second["version"] == 2
+    assert client.get(f'/api/sync?userId={user_id}').get_json()["data"] == second["data"]
+
+    assert client.post('/api/sync/merge', json={"userId": user_id, "data": [1]}).status_code == 400
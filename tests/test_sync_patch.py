@@ -0,0 +1,46 @@
+import pytest
+
+from sync_store import apply_merge_patch, apply_ops, PatchError
+
+
+def test_merge_patch_merges_objects_and_deletes_nulls():
+    target = {"a": {"b": 1, "c": 2}, "d": 3}
+    assert apply_merge_patch(target, {"a": {"b": 5, "c": None}, "e": [1]}) == {"a": {"b": 5}, "d": 3, "e": [1]}
+    assert target == {"a": {"b": 1, "c": 2}, "d": 3}
+
+
+def test_merge_patch_replaces_non_objects():
+    assert apply_merge_patch({"a": [1, 2]}, {"a": [3]}) == {"a": [3]}
+    assert apply_merge_patch({"a": 1}, {"a": {"b": 2}}) == {"a": {"b": 2}}
+
+
+def test_apply_ops_add_replace_remove():
+    document = {"scores": {"Identity": {"correct": 1}}, "history": [1, 2]}
+    result = apply_ops(document, [
+        {"op": "replace", "path": "/scores/Identity/correct", "value": 2},
+        {"op": "add", "path": "/scores/Storage", "value": {"correct": 0}},
+        {"op": "add", "path": "/history/-", "value": 3},
+        {"op": "add", "path": "/history/0", "value": 0},
+        {"op": "remove", "path": "/history/1"},
+        {"op": "add", "path": "/a~1b", "value": "slash"},
+    ])
+    assert result == {
+        "scores": {"Identity": {"correct": 2}, "Storage": {"correct": 0}},
+        "history": [0, 2, 3],
+        "a/b": "slash",
+    }
+    assert document == {"scores": {"Identity": {"correct": 1}}, "history": [1, 2]}
+
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "replace", "path": "/missing", "value": 1}],
+    [{"op": "remove", "path": "/list/5"}],
+    [{"op": "add", "path": "/nested/deeper/x", "value": 1}],
+    [{"op": "move", "from": "/a", "path": "/b"}],
+    [{"op": "add", "path": "", "value": {}}],
+    [{"op": "add", "path": "no-slash", "value": 1}],
+    ["not an op"],
+])
+def test_apply_ops_rejects_invalid_operations(ops):
+    with pytest.raises(PatchError):
+        apply_ops({"list": [1], "a": 1}, ops)
@@ -0,0 +1,253 @@
+import os
+import json
+import threading
+import sqlite3
+import logging
+
+import pytest
+
+import server
+from sync_store import JsonFileSyncStore, SqliteSyncStore, WriteBehindSyncStore, CachedSyncStore, VersionConflict, StoreUnavailable, migrate_json_files, sync_store_from_env, export_ndjson, import_ndjson
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "json":
+        return JsonFileSyncStore(str(tmp_path))
+    return SqliteSyncStore(str(tmp_path / 'sync.sqlite3'))
+
+
+def test_backends_version_each_write(backend):
+    assert backend.get("user-a") is None and backend.version("user-a") is None
+    first = backend.put("user-a", {"n": 1})
+    assert first["version"] == 1
+    assert backend.update("user-a", lambda data: dict(data, m=2), expected_version=1)["version"] == 2
+    assert backend.get("user-a")["data"] == {"n": 1, "m": 2}
+    assert backend.version("user-a") == 2
+    backend.put("user-b", {})
+    assert list(backend.user_ids()) == ["user-a", "user-b"]
+
+
+def test_backends_refuse_stale_versions(backend):
+    backend.put("user-a", {"n": 1})
+    backend.put("user-a", {"n": 2})
+    with pytest.raises(VersionConflict) as conflict:
+        backend.put("user-a", {"n": 3}, expected_version=1)
+    assert conflict.value.current_version == 2
+    assert backend.get("user-a")["data"] == {"n": 2}
+
+
+def test_failed_mutation_leaves_the_document_unchanged(backend):
+    backend.put("user-a", {"n": 1})
+
+    def broken(data):
+        raise ValueError("bad patch")
+
+    with pytest.raises(ValueError):
+        backend.update("user-a", broken)
+    assert backend.get("user-a")["data"] == {"n": 1}
+    assert backend.version("user-a") == 1
+    assert backend.put("user-a", {"n": 2})["version"] == 2
+
+
+def test_sqlite_store_opens_a_table_from_the_d1_schema(tmp_path):
+    path = str(tmp_path / 'sync.sqlite3')
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cloudflare-worker', 'schema.sql')) as f:
+        schema = f.read()
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.execute("INSERT INTO user_scores VALUES ('user-a', '{\"n\": 1}', '2026-01-01T00:00:00Z')")
+    conn.commit()
+    conn.close()
+
+    store = SqliteSyncStore(path)
+    assert store.get("user-a") == {"data": {"n": 1}, "updatedAt": "2026-01-01T00:00:00Z", "version": 1}
+    assert store.put("user-a", {"n": 2})["version"] == 2
+
+
+def test_concurrent_writers_never_lose_an_update(backend, tmp_path):
+    # One store instance per thread, as separate worker processes would have.
+    if isinstance(backend, JsonFileSyncStore):
+        make = lambda: JsonFileSyncStore(str(tmp_path))
+    else:
+        make = lambda: SqliteSyncStore(backend.db_path)
+    stores = [make() for _ in range(4)]
+
+    def work(store):
+        for _ in range(25):
+            store.update("user-a", lambda data: {"count": data.get("count", 0) + 1})
+
+    threads = [threading.Thread(target=work, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert backend.get("user-a")["data"] == {"count": 100}
+    assert backend.version("user-a") == 100
+    assert sum(store.stats()["acquisitions"] for store in stores) == 100
+
+
+class FlakySqliteStore(SqliteSyncStore):
+    # SQLite store whose batched writes fail until `failing` is cleared.
+    failing = False
+
+    def write_records(self, records):
+        if self.failing:
+            raise OSError("disk unavailable")
+        return super().write_records(records)
+
+
+@pytest.fixture
+def flaky(tmp_path):
+    return FlakySqliteStore(str(tmp_path / 'sync.sqlite3'))
+
+
+@pytest.fixture
+def buffered(flaky):
+    store = WriteBehindSyncStore(flaky, flush_interval=60, max_pending=2)
+    yield store
+    flaky.failing = False
+    store.close()
+
+
+def test_full_buffer_refuses_new_users_while_flushes_fail(flaky, buffered):
+    flaky.failing = True
+    buffered.put("user-a", {"n": 1})
+    buffered.put("user-b", {"n": 1})
+
+    with pytest.raises(StoreUnavailable):
+        buffered.put("user-c", {"n": 1})
+    assert buffered.get("user-c") is None
+    assert buffered.version("user-c") is None
+    assert buffered.counters["refused_writes"] == 1
+
+    # Users already in the buffer replace their pending record, so they
+    # cannot grow it.
+    assert buffered.put("user-a", {"n": 2})["version"] == 2
+
+    flaky.failing = False
+    assert buffered.put("user-c", {"n": 1})["version"] == 1
+    assert flaky.get("user-a")["data"] == {"n": 2}
+    assert flaky.get("user-c") is None
+
+
+def test_sync_write_gets_503_when_the_buffer_cannot_drain(client, flaky, buffered, monkeypatch):
+    monkeypatch.setattr(server, "sync_store", buffered)
+    flaky.failing = True
+    for user_id in ("user-a", "user-b"):
+        assert client.put('/api/sync', json={"userId": user_id, "data": {"n": 1}}).status_code == 200
+
+    response = client.put('/api/sync', json={"userId": "user-c", "data": {"n": 1}})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == "60"
+    assert client.get('/api/sync?userId=user-c').get_json()["found"] is False
+
+
+def write_legacy_file(directory, user_id, data, updated_at):
+    with open(directory / f"{user_id}.json", 'w') as f:
+        json.dump({"data": data, "updatedAt": updated_at, "version": 3}, f)
+
+
+def test_first_sqlite_start_imports_legacy_json_files(tmp_path, monkeypatch):
+    write_legacy_file(tmp_path, "legacy-user", {"mergedQuizScores": {}}, "2024-01-01T00:00:00.000Z")
+    (tmp_path / "not-a-user!.json").write_text("{}")
+    monkeypatch.setenv("SYNC_BACKEND", "sqlite")
+    monkeypatch.setenv("SYNC_DB_PATH", str(tmp_path / 'sync.sqlite3'))
+    monkeypatch.setenv("SYNC_CACHE_BYTES", "0")
+
+    store = sync_store_from_env(str(tmp_path))
+    assert store.get("legacy-user")["data"] == {"mergedQuizScores": {}}
+
+    # Once the database holds documents, restarts leave it alone.
+    store.put("legacy-user", {"updated": True})
+    assert sync_store_from_env(str(tmp_path)).get("legacy-user")["data"] == {"updated": True}
+
+
+def test_migrate_keeps_rows_newer_than_the_file(tmp_path):
+    store = SqliteSyncStore(str(tmp_path / 'sync.sqlite3'))
+    write_legacy_file(tmp_path, "kept", {"from": "file"}, "2024-01-01T00:00:00.000Z")
+    write_legacy_file(tmp_path, "replaced", {"from": "file"}, "2999-01-01T00:00:00.000Z")
+    store.put("kept", {"from": "db"})
+    store.put("replaced", {"from": "db"})
+
+    assert migrate_json_files(str(tmp_path), store) == {"imported": 2, "skipped": 0}
+    assert store.get("kept")["data"] == {"from": "db"}
+    assert store.get("kept")["version"] == 1
+    assert store.get("replaced")["data"] == {"from": "file"}
+    assert store.get("replaced")["version"] == 2
+
+
+def test_ndjson_export_round_trips_and_logs_skipped_lines(tmp_path, caplog):
+    source = SqliteSyncStore(str(tmp_path / 'source.sqlite3'))
+    source.put("user-a", {"n": 1})
+    source.put("user-a", {"n": 2})
+    source.put("user-b", {"n": 3})
+    lines = b"".join(export_ndjson(source)).splitlines()
+    assert len(lines) == 2
+
+    target = SqliteSyncStore(str(tmp_path / 'target.sqlite3'))
+    with caplog.at_level(logging.WARNING, logger="sync_store"):
+        summary = import_ndjson(target, lines + [b"not json", b'{"userId": "bad id!", "data": {}}'])
+    assert summary == {"imported": 2, "skipped": 2}
+    assert target.get("user-a")["data"] == {"n": 2}
+    assert target.get("user-a")["version"] == 2
+    assert [r.getMessage() for r in caplog.records] == [
+        "Skipping NDJSON line 3: Expecting value: line 1 column 1 (char 0)",
+        "Skipping NDJSON line 4: invalid userId or data",
+    ]
+
+
+class RecordingObserver:
+    def __init__(self):
+        self.batches = []
+
+    def record_writes(self, changes):
+        self.batches.append(list(changes))
+
+
+def test_write_behind_coalesces_writes_into_one_flush(tmp_path):
+    backing = SqliteSyncStore(str(tmp_path / 'sync.sqlite3'))
+    observer = RecordingObserver()
+    store = WriteBehindSyncStore(backing, flush_interval=60, observer=observer)
+    try:
+        for n in range(1, 6):
+            store.put("user-a", {"n": n})
+        store.update("user-a", lambda data: dict(data, done=True), expected_version=5)
+        with pytest.raises(VersionConflict):
+            store.put("user-a", {}, expected_version=5)
+        assert store.get("user-a")["data"] == {"n": 5, "done": True}
+        assert backing.get("user-a") is None
+
+        assert store.flush() == 1
+        assert backing.get("user-a") == store.get("user-a")
+        assert backing.version("user-a") == 6
+        assert observer.batches == [[(None, {"n": 5, "done": True})]]
+        assert store.counters["buffered_writes"] == 6 and store.counters["flushes"] == 1
+    finally:
+        store.close()
+
+
+def test_hot_cache_serves_hits_and_notices_writes_from_other_workers(tmp_path):
+    path = str(tmp_path / 'sync.sqlite3')
+    cached = CachedSyncStore(SqliteSyncStore(path))
+    cached.put("user-a", {"n": 1})
+    assert cached.get("user-a")["data"] == {"n": 1}
+    assert cached.counters["hits"] == 1
+
+    # Another process writes through its own connection.
+    SqliteSyncStore(path).put("user-a", {"n": 2})
+    assert cached.get("user-a")["data"] == {"n": 2}
+    assert cached.counters["stale"] == 1
+
+
+def test_hot_cache_stays_within_its_byte_budget(tmp_path):
+    cached = CachedSyncStore(SqliteSyncStore(str(tmp_path / 'sync.sqlite3')), max_bytes=100)
+    for user_id in ("user-a", "user-b", "user-c"):
+        cached.put(user_id, {"text": "x" * 30})
+    cached.put("user-big", {"text": "x" * 200})
+    stats = cached.stats()
+    assert stats["bytes"] <= 100
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert cached.get("user-big")["data"] == {"text": "x" * 200}
+    assert cached.get("user-a")["data"] == {"text": "x" * 30}
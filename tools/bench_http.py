@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"Server did not start on port {port}")
+
+
+def start_server(kind, port, env):
+    if kind == "dev":
+        command = [sys.executable, "server.py"]
+    elif kind == "asgi":
+        command = [sys.executable, "asgi.py"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"]
+    process = subprocess.Popen(command, cwd=ROOT, env=dict(env, PORT=str(port)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return process
+
+
+def rss_mb(pid):
+    # Resident memory of the server and its worker processes.
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return round(total / 1024, 1)
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+SCENARIOS = {
+    "static": lambda i: ("GET", "/index.html", None),
+    "sync": lambda i: ("GET", f"/api/sync?userId=bench{i % 50}", None),
+    "llm": lambda i: ("POST", "/api/generate-cprs", {"concept": f"Network Security Groups {i}", "mode": "live"}),
+}
+
+
+def run(port, scenario, requests, concurrency):
+    latencies = []
+
+    def one(index):
+        method, path, body = SCENARIOS[scenario](index)
+        start = time.perf_counter()
+        try:
+            status = request(port, method, path, body)
+        except OSError:
+            status = 599
+        latencies.append(time.perf_counter() - start)
+        return status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {
+        "scenario": scenario,
+        "requests": requests,
+        "errors": sum(1 for s in statuses if s >= 400),
+        "req_per_sec": round(requests / elapsed, 1),
+        "p50_ms": round(pct(0.50), 1),
+        "p99_ms": round(pct(0.99), 1),
+    }
+
+
+def background_llm(port, concurrency, stop):
+    # Keeps `concurrency` LLM requests in flight until stopped, so the
+    # measured scenarios show how other routes fare behind model calls.
+    def loop(worker):
+        index = worker
+        while not stop.is_set():
+            method, path, body = SCENARIOS["llm"](index)
+            try:
+                request(port, method, path, body)
+            except OSError:
+                pass
+            index += concurrency
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dev server, gunicorn and the async entry point over real HTTP.")
+    parser.add_argument("--servers", default="dev,gunicorn,asgi")
+    parser.add_argument("--scenarios", default="static,sync,llm")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated model latency in seconds for the llm scenario")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--background-llm", type=int, default=0,
+                        help="Keep this many LLM requests in flight while measuring the scenarios")
+    args = parser.parse_args()
+
+    for kind in args.servers.split(","):
+        scratch = tempfile.mkdtemp(prefix="az104-http-bench-")
+        env = dict(
+            os.environ,
+            LLM_PROVIDER="fake",
+            FAKE_LLM_LATENCY=str(args.latency),
+            SYNC_DB_PATH=os.path.join(scratch, "sync.sqlite3"),
+            ANALYTICS_DB_PATH=os.path.join(scratch, "analytics.sqlite3"),
+            CPRS_BANK_PATH=os.path.join(scratch, "cprs_bank.sqlite3"),
+            LLM_CACHE_DIR=os.path.join(scratch, "llm_cache"),
+            GUNICORN_ACCESS_LOG="",
+        )
+        process = start_server(kind, args.port, env)
+        try:
+            for i in range(50):
+                request(args.port, "PUT", "/api/sync", {"userId": f"bench{i}", "data": {"mergedQuizScores": {"Storage": {"correct": i, "total": 50}}}})
+            stop = threading.Event()
+            background = background_llm(args.port, args.background_llm, stop)
+            if background:
+                time.sleep(2)
+            try:
+                for scenario in args.scenarios.split(","):
+                    result = run(args.port, scenario, args.requests, args.concurrency)
+                    print(json.dumps(dict(result, server=kind, rss_mb=rss_mb(process.pid))))
+            finally:
+                stop.set()
+                for thread in background:
+                    thread.join(timeout=60)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
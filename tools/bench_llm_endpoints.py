@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import time
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+SCRATCH = tempfile.mkdtemp(prefix="az104-bench-")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_CACHE_DIR", os.path.join(SCRATCH, "llm_cache"))
+os.environ.setdefault("CPRS_BANK_PATH", os.path.join(SCRATCH, "cprs_bank.sqlite3"))
+
+import server  # noqa: E402
+
+
+SAMPLE_REVIEW = (
+    "Question 12: You need to restrict inbound RDP to a VM. You chose Azure Firewall; "
+    "the correct answer was an NSG rule on the subnet. Question 13: Blob lifecycle management "
+    "moves data from Hot to Cool after 30 days. Question 14: VNet Peering is non-transitive."
+)
+
+
+def run(client, path, body, requests, concurrency):
+    latencies = []
+
+    def one(index):
+        start = time.perf_counter()
+        response = client.post(path, json=body(index) if callable(body) else body)
+        latencies.append(time.perf_counter() - start)
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {
+        "path": path,
+        "requests": requests,
+        "errors": sum(1 for s in statuses if s >= 400),
+        "req_per_sec": round(requests / elapsed, 1),
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Flask LLM endpoints against the fake provider (no network).")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated model latency in seconds")
+    parser.add_argument("--unique", action="store_true", help="Vary inputs so caches and the question bank miss")
+    args = parser.parse_args()
+
+    server.llm_provider.latency = args.latency
+    client = server.app.test_client()
+
+    results = []
+    if args.unique:
+        review = lambda index: {"text": f"{SAMPLE_REVIEW} Attempt {index}."}
+    else:
+        review = {"text": SAMPLE_REVIEW}
+    results.append(run(client, "/api/extract-concepts", review, args.requests, args.concurrency))
+    body = {"concept": "Network Security Groups", "mode": "live" if args.unique else "auto"}
+    results.append(run(client, "/api/generate-cprs", body, args.requests, args.concurrency))
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()